@@ -0,0 +1,252 @@
+#!/usr/local/bin/python
+import gc, json, math, optparse, platform, sys
+import gen_tilemap
+from gen_tilemap import generate
+from instrument import instrumentation
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Benchmark parameters
+BENCHMARK_SEEDS = (1415535932, 1415878236, 1415878343, 1415878501, 1000, 1001)
+BENCHMARK_SIZES = ((96, 32), (192, 64), (384, 128), (768, 256))
+BENCHMARK_OUTPUT = 'bench_output.txt'
+
+# Changes in time smaller than this fraction are reported as unchanged
+COMPARE_TOLERANCE = 0.1
+
+
+# The stages timed, as named by `instrumentation.stage()` in `gen_tilemap.generate`
+STAGES = (
+    'rooms',
+    'filled_rooms',
+    'floors_and_ceilings',
+    'random_walls',
+    'required_walls',
+    'stairs',
+    'random_ladders',
+    'walk_graph',
+    )
+
+
+def peak_rss():
+    """Return the peak resident memory of this process so far, in bytes, or None."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return (peak if sys.platform == 'darwin' else peak * 1024)
+
+class StageMeter(object):
+    """
+    Instrumentation sink measuring each stage of `generate()` from its
+    `stage_start` and `stage_end` events: its `duration` and, with
+    `tracemalloc`, the most bytes it had allocated at once and the bytes
+    it left allocated. Without `tracemalloc` (Python 2), the number of
+    objects it left for the garbage collector is found instead.
+
+    Sinks are called outside the timed part of a stage, so measuring
+    memory doesn't add to the times. `measured` maps each stage name in
+    `STAGES` to a dict of its measures for the latest map.
+    """
+
+    def __init__(self):
+        self.measured = {}
+        self._start = None
+
+    def __call__(self, event):
+        if event['stage'] not in STAGES:
+            return
+        if event['event'] == 'stage_start':
+            gc.collect()
+            if tracemalloc is not None:
+                if hasattr(tracemalloc, 'reset_peak'):
+                    tracemalloc.reset_peak()
+                else:
+                    tracemalloc.clear_traces()
+                self._start = tracemalloc.get_traced_memory()[0]
+            else:
+                self._start = len(gc.get_objects())
+        elif event['event'] == 'stage_end':
+            result = {'time': event['duration']}
+            if tracemalloc is not None:
+                memory, peak = tracemalloc.get_traced_memory()
+                result['allocated'] = peak - self._start
+                result['retained'] = memory - self._start
+            else:
+                result['objects'] = len(gc.get_objects()) - self._start
+            self.measured[event['stage']] = result
+
+def run_benchmark(seeds=BENCHMARK_SEEDS, sizes=BENCHMARK_SIZES, repeat=1):
+    """
+    Generate a map for each of `seeds` at each of `sizes`, `repeat` times,
+    timing every stage, and return the results as a JSON-compatible dict.
+
+    `results[size][stage]` has the fastest total `time` over the seeds,
+    and the largest `allocated` and `retained` bytes (or `objects`) of
+    any seed. The `peak_rss` after each size is the peak for the whole
+    run so far.
+    """
+    verbose = gen_tilemap.VERBOSE
+    gen_tilemap.VERBOSE = False
+    if tracemalloc is not None:
+        tracemalloc.start()
+    results = {}
+    meter = StageMeter()
+    instrumentation.sinks.append(meter)
+    try:
+        for width, height in sizes:
+            size_key = '%dx%d' % (width, height)
+            stages = dict((name, {'time': None}) for name in STAGES)
+            for run in range(repeat):
+                totals = dict((name, 0.0) for name in STAGES)
+                for seed in seeds:
+                    meter.measured = {}
+                    generate(seed, width, height)
+                    for name in STAGES:
+                        measured = meter.measured[name]
+                        totals[name] += measured['time']
+                        for key in ('allocated', 'retained', 'objects'):
+                            if key in measured:
+                                stages[name][key] = max(stages[name].get(key, 0), measured[key])
+                for name in totals:
+                    if stages[name]['time'] is None or totals[name] < stages[name]['time']:
+                        stages[name]['time'] = totals[name]
+            results[size_key] = {
+                'tiles': width * height,
+                'stages': stages,
+                'peak_rss': peak_rss(),
+                }
+    finally:
+        instrumentation.sinks.remove(meter)
+        gen_tilemap.VERBOSE = verbose
+        if tracemalloc is not None:
+            tracemalloc.stop()
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seeds': list(seeds),
+        'repeat': repeat,
+        'sizes': results,
+        'scaling': scaling(results),
+        }
+
+def scaling(results):
+    """
+    Return a dict of each stage's scaling exponent: the slope of a least
+    squares fit of log time against log tiles over the sizes, so 1 is
+    linear in the map area and 2 quadratic.
+    """
+    exponents = {}
+    for name in STAGES:
+        points = [(math.log(size['tiles']), math.log(size['stages'][name]['time']))
+            for size in results.values() if size['stages'][name]['time'] > 0]
+        if len(points) < 2:
+            exponents[name] = None
+            continue
+        mean_x = sum(x for x, y in points) / len(points)
+        mean_y = sum(y for x, y in points) / len(points)
+        spread = sum((x - mean_x) ** 2 for x, y in points)
+        exponents[name] = (sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+            if spread else None)
+    return exponents
+
+def compare(old, new, tolerance=COMPARE_TOLERANCE):
+    """Return a list of lines comparing the times of two benchmark results."""
+    lines = ['%-20s %-10s %10s %10s %8s' % ('stage', 'size', 'old ms', 'new ms', 'change')]
+    sizes = sorted(set(old['sizes']) & set(new['sizes']),
+        key=lambda size: new['sizes'][size]['tiles'])
+    for name in STAGES:
+        for size in sizes:
+            old_time = old['sizes'][size]['stages'].get(name, {}).get('time')
+            new_time = new['sizes'][size]['stages'][name]['time']
+            if not old_time:
+                continue
+            ratio = new_time / old_time
+            if ratio < 1 - tolerance:
+                verdict = 'faster'
+            elif ratio > 1 + tolerance:
+                verdict = 'SLOWER'
+            else:
+                verdict = ''
+            lines.append('%-20s %-10s %10.1f %10.1f %7.2fx %s' % (name, size,
+                1000 * old_time, 1000 * new_time, ratio, verdict))
+    for name in STAGES:
+        old_exponent = old.get('scaling', {}).get(name)
+        new_exponent = new['scaling'][name]
+        if old_exponent is not None and new_exponent is not None:
+            lines.append('%-20s scaling %.2f -> %.2f' % (name, old_exponent, new_exponent))
+    return lines
+
+def format_results(results):
+    """Return a list of lines summarising benchmark results."""
+    lines = ['%-20s %-10s %10s %12s' % ('stage', 'size', 'ms', 'memory')]
+    sizes = sorted(results['sizes'], key=lambda size: results['sizes'][size]['tiles'])
+    for name in STAGES:
+        for size in sizes:
+            measured = results['sizes'][size]['stages'][name]
+            if 'allocated' in measured:
+                memory = '%dB' % measured['allocated']
+            else:
+                memory = '%d objects' % measured['objects']
+            lines.append('%-20s %-10s %10.1f %12s' % (name, size, 1000 * measured['time'], memory))
+        exponent = results['scaling'][name]
+        if exponent is not None:
+            lines.append('%-20s scaling %.2f' % (name, exponent))
+    return lines
+
+
+def parse_sizes(spec):
+    """Return the sizes in `spec`, a comma-separated list of `WIDTHxHEIGHT`."""
+    sizes = []
+    for size in spec.split(','):
+        width, height = size.split('x')
+        sizes.append((int(width), int(height)))
+    return sizes
+
+def main(argv=None):
+    parser = optparse.OptionParser(
+        usage="%prog [options]",
+        description="Time each stage of map generation over a fixed set of "
+            "seeds and a range of map sizes, and write the results as JSON.")
+    parser.add_option('-s', '--seeds', default=','.join(str(seed) for seed in BENCHMARK_SEEDS),
+        help="comma-separated seeds (default %default)")
+    parser.add_option('--sizes', default=','.join('%dx%d' % size for size in BENCHMARK_SIZES),
+        help="comma-separated WIDTHxHEIGHT map sizes (default %default)")
+    parser.add_option('-r', '--repeat', type='int', default=3,
+        help="runs of each size, keeping the fastest (default %default)")
+    parser.add_option('-o', '--output', default=BENCHMARK_OUTPUT,
+        help="file to write the JSON results to (default %default)")
+    parser.add_option('-c', '--compare', default=None, metavar='FILE',
+        help="compare with the JSON results of a previous run")
+    options, args = parser.parse_args(argv)
+    if args:
+        parser.error("unexpected arguments: %s" % ' '.join(args))
+    try:
+        seeds = [int(seed) for seed in options.seeds.split(',')]
+        sizes = parse_sizes(options.sizes)
+    except ValueError:
+        parser.error("invalid seeds or sizes")
+
+    previous = None
+    if options.compare:
+        with open(options.compare) as f:
+            previous = json.load(f)
+
+    results = run_benchmark(seeds, sizes, repeat=options.repeat)
+    with open(options.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+    lines = (compare(previous, results) if previous else format_results(results))
+    sys.stdout.write('\n'.join(lines) + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+__all__ = ('Chunk', 'ChunkedWorld', 'CHUNK_WIDTH', 'CHUNK_HALO')
+
+import random
+from gen_tilemap import *
+from tilemap import *
+
+# Chunk parameters
+CHUNK_WIDTH = 64
+CHUNK_HALO = 1
+
+
+class Chunk(object):
+    """
+    One finished chunk of a `ChunkedWorld`.
+
+    `tile_map` and `rooms` cover just the chunk, whose left edge is at
+    world x `x`. `walk_graph` has the edges from every walkable coord in
+    the chunk, including those onto the halo columns of its neighbours,
+    in coordinates whose x starts at world x `walk_graph_x`.
+    """
+
+    def __init__(self, index, x, tile_map, rooms, walk_graph, walk_graph_x):
+        self.index = index
+        self.x = x
+        self.tile_map = tile_map
+        self.rooms = rooms
+        self.walk_graph = walk_graph
+        self.walk_graph_x = walk_graph_x
+
+    def neighbors(self, coord):
+        """Return a list of the world coords reachable in one step from world `coord`."""
+        dx = self.walk_graph_x
+        return [Coord(other.x + dx, other.y)
+            for other in self.walk_graph.neighbors(Coord(coord[0] - dx, coord[1]))]
+
+
+class ChunkedWorld(object):
+    """
+    A world of unbounded width, generated a chunk at a time from `seed`.
+
+    Each chunk is generated in three phases, each with its own
+    `random.Random` seeded from `(seed, chunk index, phase)`:
+
+      1. Rooms, filled rooms, floors and ceilings, and random walls.
+      2. Required walls, seeing a halo of `halo` columns of the
+         neighbouring chunks' phase 1 tiles, so doorways match across
+         the seam. Chunk 0 has no left halo, as it is the edge of the world.
+      3. Stairs and ladders, kept within the chunk.
+
+    The walk graph of a chunk is then found over the finished chunk and
+    the finished halo columns of its neighbours. So every chunk depends
+    only on the seed and the chunk indices next to it, and only the
+    chunks around the most recently generated ones are kept in memory.
+    """
+
+    def __init__(self, seed, chunk_width=CHUNK_WIDTH, height=TILE_MAP_HEIGHT,
+            halo=CHUNK_HALO, cache_size=3):
+        assert chunk_width > halo >= 1
+        self.seed = seed
+        self.chunk_width = chunk_width
+        self.height = height
+        self.halo = halo
+        # Finishing a chunk needs the layouts either side of it, and a
+        # chunk's walk graph needs the finished chunks either side of it.
+        self._layouts = _Cache(self._layout, 5)
+        self._finished = _Cache(self._finish, 3)
+        self._chunks = _Cache(self._chunk, cache_size)
+
+    def chunk(self, index):
+        """Return the `Chunk` at `index` (from 0 at the left of the world)."""
+        if index < 0:
+            raise IndexError(index)
+        return self._chunks[index]
+
+    def chunks(self, start=0):
+        """Yield the chunks from `start` rightwards, on demand, forever."""
+        index = start
+        while True:
+            yield self.chunk(index)
+            index += 1
+
+    def _rng(self, index, phase):
+        return random.Random((self.seed << 40) + (index << 2) + phase)
+
+    def _window(self, index, level):
+        """
+        Return `(window, x)`: a copy of chunk `index` from the cache
+        `level` with `halo` columns of its neighbours each side (none to
+        the left of chunk 0), and the x of the chunk in the window.
+        """
+        width = self.chunk_width
+        left = (self.halo if index > 0 else 0)
+        window = TileMap(width=left + width + self.halo, height=self.height)
+        window[left:left + width, :] = level[index][0]
+        if left:
+            window[:left, :] = level[index - 1][0][width - left:, :]
+        window[left + width:, :] = level[index + 1][0][:self.halo, :]
+        return window, left
+
+    def _layout(self, index):
+        rng = self._rng(index, 0)
+        tile_map = TileMap(width=self.chunk_width, height=self.height)
+        rooms = generate_rooms(tile_map, rng=rng)
+        for room in rooms:
+            room.track_tiles()
+        for room in rooms:
+            generate_filled_room(room, rng=rng)
+        for room in rooms:
+            generate_floor_and_ceiling(room, rng=rng)
+        for room in rooms:
+            generate_random_walls(room, rng=rng)
+        for room in rooms:
+            room.untrack_tiles()
+        return tile_map, rooms
+
+    def _finish(self, index):
+        window, x = self._window(index, self._layouts)
+        rooms = _rebase_rooms(self._layouts[index][1], window.storage, x)
+        rng = self._rng(index, 1)
+        for room in rooms:
+            room.track_tiles()
+        for room in rooms:
+            generate_required_walls(room, left_hand=True, rng=rng)
+            generate_required_walls(room, left_hand=False, rng=rng)
+        for room in rooms:
+            room.untrack_tiles()
+
+        tile_map = TileMap(width=self.chunk_width, height=self.height)
+        tile_map[:, :] = window[x:x + self.chunk_width, :]
+        rooms = _rebase_rooms(rooms, tile_map.storage, -x)
+        rng = self._rng(index, 2)
+        generate_floor_stairs(tile_map, rng=rng)
+        generate_random_ladders(tile_map, rng=rng)
+        return tile_map, rooms
+
+    def _chunk(self, index):
+        tile_map, rooms = self._finished[index]
+        window, x = self._window(index, self._finished)
+        sources = Coord.range((x, 0), (x + self.chunk_width, self.height))
+        walk_graph = calculate_walk_graph(window, sources=sources)
+        world_x = index * self.chunk_width
+        return Chunk(index, world_x, tile_map, rooms, walk_graph, world_x - x)
+
+
+def _rebase_rooms(rooms, storage, dx):
+    """Return copies of `rooms` as views onto `storage`, moved `dx` tiles right."""
+    rebased = []
+    for room in rooms:
+        other = Room(tl=room.tl + (dx, 0), br=room.br + (dx, 0), storage=storage)
+        other.floor_height = room.floor_height
+        other.ceiling_height = room.ceiling_height
+        other.left_wall_width = room.left_wall_width
+        other.right_wall_width = room.right_wall_width
+        rebased.append(other)
+    return rebased
+
+
+class _Cache(object):
+    """The results of `build(key)` for the `size` most recently used keys."""
+
+    def __init__(self, build, size):
+        self.build = build
+        self.size = size
+        self.values = {}
+        self.order = []
+
+    def __getitem__(self, key):
+        if key in self.values:
+            self.order.remove(key)
+        else:
+            value = self.build(key)
+            if len(self.order) >= self.size:
+                del self.values[self.order.pop(0)]
+            self.values[key] = value
+        self.order.append(key)
+        return self.values[key]
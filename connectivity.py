@@ -0,0 +1,178 @@
+__all__ = ('Connectivity', 'describe_summary', 'strongly_connected_components')
+
+from array import array
+
+
+def strongly_connected_components(graph):
+    """
+    Return `(components, count)` for the `WalkGraph` `graph`, where
+    `components` is an `array('i')` of the component id of each node id
+    (-1 for tiles not in the graph), and there are `count` components.
+
+    This is Tarjan's algorithm, with an explicit stack rather than
+    recursion, so it takes time linear in the size of the graph however
+    long its paths are. Components are numbered in reverse topological
+    order: every edge between two components goes to the lower id.
+    """
+    size = graph.width * graph.height
+    nodes = graph.nodes
+    offsets = graph.offsets
+    targets = graph.targets
+    order = array('i', [-1]) * size
+    low = array('i', [0]) * size
+    components = array('i', [-1]) * size
+    stack = []
+    count = 0
+    next_order = 0
+
+    root = nodes.find(b'\x01')
+    while root != -1:
+        if order[root] == -1:
+            order[root] = low[root] = next_order
+            next_order += 1
+            stack.append(root)
+            # (node, position of its next edge to follow)
+            calls = [(root, offsets[root])]
+            while calls:
+                node, i = calls[-1]
+                stop = offsets[node + 1]
+                # Follow edges until one leads to an unvisited node
+                while i < stop:
+                    target = targets[i]
+                    i += 1
+                    if order[target] == -1:
+                        break
+                    if components[target] == -1 and order[target] < low[node]:
+                        low[node] = order[target]
+                else:
+                    target = -1
+                if target != -1:
+                    calls[-1] = (node, i)
+                    order[target] = low[target] = next_order
+                    next_order += 1
+                    stack.append(target)
+                    calls.append((target, offsets[target]))
+                    continue
+                # All edges followed: return from `node`
+                calls.pop()
+                if low[node] == order[node]:
+                    while True:
+                        member = stack.pop()
+                        components[member] = count
+                        if member == node:
+                            break
+                    count += 1
+                if calls:
+                    parent = calls[-1][0]
+                    if low[node] < low[parent]:
+                        low[parent] = low[node]
+        root = nodes.find(b'\x01', root + 1)
+    return components, count
+
+
+class Connectivity(object):
+    """
+    Strongly connected components of a `WalkGraph`, and what they say
+    about how well the map can be got around.
+
+    A trap component is one from which the start of the graph cannot be
+    reached again: once the player walks (or drops) into it, they cannot
+    get back out. A one-way edge is one between two components, which
+    can't be walked back along any route.
+
+    `walkable_count` is the number of walkable tiles in the whole map (see
+    `gen_tilemap.calculate_walkable`), for `reachable_fraction`.
+    """
+
+    def __init__(self, graph, walkable_count=None):
+        self.graph = graph
+        self.walkable_count = walkable_count
+        self.components, self.component_count = strongly_connected_components(graph)
+        components = self.components
+
+        self.sizes = [0] * self.component_count
+        node = graph.nodes.find(b'\x01')
+        while node != -1:
+            self.sizes[components[node]] += 1
+            node = graph.nodes.find(b'\x01', node + 1)
+
+        # Edges between components, in node order
+        offsets, targets = graph.offsets, graph.targets
+        self.one_way_edges = []
+        successors = [[] for component in range(self.component_count)]
+        node = graph.nodes.find(b'\x01')
+        while node != -1:
+            component = components[node]
+            for i in range(offsets[node], offsets[node + 1]):
+                other = components[targets[i]]
+                if other != component:
+                    self.one_way_edges.append((node, targets[i], graph.kinds[i]))
+                    successors[component].append(other)
+            node = graph.nodes.find(b'\x01', node + 1)
+
+        # Every edge goes to a lower component id, so going up from 0 the
+        # successors of each component are already known to escape or not.
+        if graph.start is not None and graph.nodes[graph.start]:
+            start_component = components[graph.start]
+        else:
+            start_component = None
+        escapes = bytearray(self.component_count)
+        for component in range(self.component_count):
+            if component == start_component:
+                escapes[component] = 1
+            else:
+                for other in successors[component]:
+                    if escapes[other]:
+                        escapes[component] = 1
+                        break
+        self.start_component = start_component
+        self.trap_components = [component for component in range(self.component_count)
+            if not escapes[component]]
+
+    @property
+    def node_count(self):
+        return len(self.graph)
+
+    @property
+    def trapped_count(self):
+        """Number of nodes in trap components."""
+        return sum(self.sizes[component] for component in self.trap_components)
+
+    @property
+    def reachable_fraction(self):
+        """Fraction of the walkable tiles that are in the graph, or None if
+        `walkable_count` was not given."""
+        if not self.walkable_count:
+            return None
+        return float(self.node_count) / self.walkable_count
+
+    def component_coords(self, component):
+        """Return a list of the coords in `component`, in row-major order."""
+        graph = self.graph
+        return [graph.coord(node) for node in range(len(self.components))
+            if self.components[node] == component]
+
+    def summary(self):
+        """Return a dict of the headline numbers, for logging or export."""
+        return {
+            'nodes': self.node_count,
+            'components': self.component_count,
+            'trap_components': len(self.trap_components),
+            'trapped_nodes': self.trapped_count,
+            'one_way_edges': len(self.one_way_edges),
+            'reachable_fraction': self.reachable_fraction,
+            }
+
+    def describe(self):
+        return describe_summary(self.summary())
+
+
+def describe_summary(summary):
+    """Return a one line description of a `Connectivity.summary()`."""
+    parts = []
+    if summary['reachable_fraction'] is not None:
+        parts.append('%d%% reachable' % round(100 * summary['reachable_fraction']))
+    parts.append('%d trap component%s (%d tiles)' % (summary['trap_components'],
+        '' if summary['trap_components'] == 1 else 's', summary['trapped_nodes']))
+    parts.append('%d one-way edges' % summary['one_way_edges'])
+    return ', '.join(parts)
@@ -0,0 +1,102 @@
+__all__ = ('FORMATS', 'encode_map', 'write_encoded', 'write_map')
+
+import json, os
+import mapfile, render
+
+# One character per tile value in text maps; values past the end are '?'
+_TILE_CHARS = b'0123456789abcdefghijklmnopqrstuvwxyz'
+_TILE_CHAR_TABLE = bytearray(_TILE_CHARS) + bytearray(b'?') * (256 - len(_TILE_CHARS))
+
+
+def _map_rows(tile_map):
+    """Return the rows of `tile_map` as lines of tile characters."""
+    raster = tile_map.translate(_TILE_CHAR_TABLE)
+    width = tile_map.width
+    return [bytes(raster[y:y + width]) for y in range(0, len(raster), width)]
+
+def _room_fields(room):
+    return [room.tl.x, room.tl.y, room.br.x, room.br.y,
+        room.floor_height, room.ceiling_height,
+        room.left_wall_width, room.right_wall_width]
+
+def _walk_graph_items(walk_graph):
+    """Return the `(coord, reachable)` items of `walk_graph` in row-major order."""
+    return sorted(walk_graph.items(), key=lambda item: (item[0].y, item[0].x))
+
+
+def encode_text(seed, tile_map, rooms, walk_graph, **options):
+    """Encode a map as plain text files: the tiles (one character per
+    tile), the rooms (one per line) and the walk graph (one line per
+    walkable coordinate, followed by the coordinates reachable from it)."""
+    tiles = b'\n'.join(_map_rows(tile_map)) + b'\n'
+    room_lines = []
+    for room in rooms:
+        room_lines.append(' '.join(str(field) for field in _room_fields(room)))
+    walk_lines = []
+    for coord, reachable in _walk_graph_items(walk_graph):
+        fields = ['%d,%d' % (coord.x, coord.y)]
+        fields.extend('%d,%d' % (other.x, other.y) for other in reachable)
+        walk_lines.append(' '.join(fields))
+    return [
+        ('map.txt', tiles),
+        ('rooms.txt', ('\n'.join(room_lines) + '\n').encode('ascii')),
+        ('walk.txt', ('\n'.join(walk_lines) + '\n').encode('ascii')),
+        ]
+
+def encode_json(seed, tile_map, rooms, walk_graph, **options):
+    """Encode a map as a single JSON document."""
+    document = {
+        'seed': seed,
+        'width': tile_map.width,
+        'height': tile_map.height,
+        'tiles': [row.decode('ascii') for row in _map_rows(tile_map)],
+        'rooms': [_room_fields(room) for room in rooms],
+        'walk_graph': [[coord.x, coord.y, [[other.x, other.y] for other in reachable]]
+            for coord, reachable in _walk_graph_items(walk_graph)],
+        }
+    data = json.dumps(document, sort_keys=True, separators=(',', ':'))
+    return [('json', data.encode('ascii'))]
+
+def encode_binary(seed, tile_map, rooms, walk_graph, tile_names=None, params_hash=0, **options):
+    """Encode a map as a single `mapfile` with rooms and walk graph
+    sections, which can be loaded back with `mapfile.load()`."""
+    data = mapfile.encode(tile_map, seed=seed, params_hash=params_hash,
+        tile_names=tile_names, rooms=rooms, walk_graph=walk_graph)
+    return [('map', data)]
+
+def encode_png(seed, tile_map, rooms, walk_graph, tile_colors=None, image_scale=1, **options):
+    """Encode a map as a PNG image of its tiles, `image_scale` pixels per tile."""
+    return [('png', render.encode_png(*render.render(tile_map, tile_colors or {}, image_scale)))]
+
+def encode_ppm(seed, tile_map, rooms, walk_graph, tile_colors=None, image_scale=1, **options):
+    """Encode a map as a PPM image of its tiles, `image_scale` pixels per tile."""
+    return [('ppm', render.encode_ppm(*render.render(tile_map, tile_colors or {}, image_scale)))]
+
+
+FORMATS = {
+    'text': encode_text,
+    'json': encode_json,
+    'binary': encode_binary,
+    'png': encode_png,
+    'ppm': encode_ppm,
+    }
+
+def encode_map(format, seed, tile_map, rooms, walk_graph, **options):
+    """Return a list of `(suffix, data)` pairs encoding a map in `format`.
+
+    `options` (`tile_names` and `params_hash`) describe how the map was
+    generated, for formats that record it, and `tile_colors` and
+    `image_scale` how image formats draw it."""
+    return FORMATS[format](seed, tile_map, rooms, walk_graph, **options)
+
+def write_map(output_dir, format, seed, tile_map, rooms, walk_graph, **options):
+    """Write a map in `format` to `output_dir`, as `<seed>.<suffix>` files."""
+    write_encoded(output_dir, seed,
+        encode_map(format, seed, tile_map, rooms, walk_graph, **options))
+
+def write_encoded(output_dir, seed, encoded):
+    """Write the `(suffix, data)` pairs from `encode_map()` to `output_dir`."""
+    for suffix, data in encoded:
+        path = os.path.join(output_dir, '%d.%s' % (seed, suffix))
+        with open(path, 'wb') as f:
+            f.write(data)
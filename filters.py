@@ -1,18 +1,43 @@
 
 ## Filtering ################################################################
 
+def mask_table(tiles):
+    """Return a `translate()` table mapping each of `tiles` to 1 and all other tiles to 0."""
+    table = bytearray(256)
+    for tile in tiles:
+        if tile is not None and 0 <= tile < 256:
+            table[tile] = 1
+    return table
+
+_NOT_TABLE = bytearray([1, 0]) + bytearray(254)
+
 def is_not(predicate):
     def not_predicate(*args):
         return not predicate(*args)
+    mask = getattr(predicate, 'mask', None)
+    if mask is not None:
+        def not_mask(tile_map):
+            return mask(tile_map).translate(_NOT_TABLE)
+        not_predicate.mask = not_mask
+    if hasattr(predicate, 'tiles'):
+        not_predicate.not_tiles = predicate.tiles
     return not_predicate
 
 def is_tile(*tiles):
     """Return a predicate function for `find()` that will
-    find all coordinates containing one of `tiles`."""
+    find all coordinates containing one of `tiles`.
+
+    The predicate also has a `mask(tile_map)` form that returns
+    the boolean raster of the whole view in one pass."""
     tiles = set(tiles)
     def predicate(tile_map, coord):
         tile = tile_map[coord]
         return (tile in tiles)
+    table = mask_table(tiles)
+    def mask(tile_map):
+        return tile_map.translate(table)
+    predicate.tiles = frozenset(tiles)
+    predicate.mask = mask
     return predicate
 
 
@@ -1,10 +1,14 @@
 #!/usr/local/bin/python
-import itertools, random, time, sys
+import hashlib, itertools, multiprocessing, optparse, os, random, re, struct, time, sys
 from collections import defaultdict
 from color import ColorGenerator
+from connectivity import *
 from filters import *
-from gui import *
+from instrument import JsonLinesSink, instrumentation
+from roomindex import *
 from tilemap import *
+from walkgraph import *
+import export, raster
 from util import *
 
 # Generation parameters
@@ -43,6 +47,38 @@ WALK_DROP_HEIGHT = 8
 STAIR_CHANCE = 1
 STAIR_MAXIMUM_HEIGHT = 4
 
+# Quality gates: the (minimum, maximum) allowed for measures of a map
+# checked between stages, either of which may be None (see check_gates)
+QUALITY_GATES = {
+    # Rooms per 1000 tiles
+    'room_density': (8.0, None),
+    # Fraction of rooms smaller than twice the minimum room area
+    'small_rooms': (None, 0.55),
+    # Fraction of tiles that are solid, once floors and ceilings are placed
+    'fill': (0.35, 0.42),
+    # Stair locations per 1000 tiles
+    'stair_density': (2.5, None),
+    # Ladder positions per 1000 tiles
+    'ladder_density': (50.0, None),
+    }
+
+# Rows generated at a time by generate_in_bands (a multiple of the room height)
+BAND_HEIGHT = 16 * ROOM_MAXIMUM_HEIGHT
+
+# The parameters above that change what is generated (see parameter_hash)
+GENERATION_PARAMETERS = (
+    'ROOM_SPLIT_X_CHANCE', 'ROOM_MINIMUM_HEIGHT', 'ROOM_MAXIMUM_HEIGHT',
+    'ROOM_MINIMUM_WIDTH', 'ROOM_MAXIMUM_WIDTH',
+    'FILLED_CHANCE', 'FILLED_MAXIMUM_WIDTH', 'FILLED_MAXIMUM_HEIGHT',
+    'FLOOR_MINIMUM', 'FLOOR_MAXIMUM', 'CEILING_MINIMUM', 'CEILING_MAXIMUM',
+    'FLOOR_TO_CEILING_MINIMUM',
+    'WALL_CHANCE', 'WALL_MINIMUM', 'WALL_MAXIMUM', 'WALL_MINIMUM_DOORWAY',
+    'LADDER_DENSITY', 'LADDER_MINIMUM_HEIGHT', 'LADDER_MAXIMUM_HEIGHT',
+    'LADDER_HORIZONTAL_SPACE', 'LADDER_VERTICAL_SPACE',
+    'WALK_DROP_HEIGHT',
+    'STAIR_CHANCE', 'STAIR_MAXIMUM_HEIGHT',
+    )
+
 # Tile types
 TILE_EMPTY = 0
 TILE_FLOOR = 1
@@ -52,62 +88,388 @@ TILE_LADDER = 4
 TILE_STAIR = 5
 SOLID_TILES = set([TILE_FLOOR, TILE_CEILING, TILE_WALL, TILE_STAIR])
 
-# seed = int(time.time())
-seed = 1415535932 # Contains an area can enter but not leave
-# seed = 1415878236 # Neat layout
-# seed = 1415878343 # Mostly unreachable!
-# seed = 1415878501 # Another neat layout
-print "random seed:", seed
-random.seed(seed)
+TILE_NAMES = {
+    TILE_EMPTY: 'empty',
+    TILE_FLOOR: 'floor',
+    TILE_CEILING: 'ceiling',
+    TILE_WALL: 'wall',
+    TILE_LADDER: 'ladder',
+    TILE_STAIR: 'stair',
+    }
+
+# Translation table leaving tile values as they are
+IDENTITY_TABLE = bytearray(range(256))
+
+# Window row classes for ladder placement: mixed, all empty, all solid
+LADDER_WINDOW_CLASSES = bytearray(b'MES') + bytearray(b'M') * 253
+
+TILE_COLORS = {
+    TILE_EMPTY: '#000000',
+    TILE_FLOOR: '#333366',
+    TILE_CEILING: '#663333',
+    TILE_WALL: '#663366',
+    TILE_LADDER: '#ff6666',
+    TILE_STAIR: '#6666ff',
+    None: '',
+    }
+
+# DEFAULT_SEED = int(time.time())
+DEFAULT_SEED = 1415535932 # Contains an area can enter but not leave
+# DEFAULT_SEED = 1415878236 # Neat layout
+# DEFAULT_SEED = 1415878343 # Mostly unreachable!
+# DEFAULT_SEED = 1415878501 # Another neat layout
+
+VERBOSE = True
 
 def log(s):
+    if not VERBOSE:
+        return
     sys.stderr.write(s)
     sys.stderr.write('\n')
     sys.stderr.flush()
 
-def main():
-    tile_size = 8
-    tile_map = TileMap(width=TILE_MAP_WIDTH, height=TILE_MAP_HEIGHT)
-    log("Rooms...")
-    rooms = generate_rooms(tile_map)
-    log("Filled rooms...")
-    for room in rooms:
-        generate_filled_room(room)
-    log("Floors and ceilings...")
-    for room in rooms:
-        generate_floor_and_ceiling(room)
-    log("Random walls...")
-    for room in rooms:
-        generate_random_walls(room)
-    log("Required walls...")
-    for room in rooms:
-        generate_required_walls(room, left_hand=True)
-        generate_required_walls(room, left_hand=False)
-    log("Stairs...")
-    generate_floor_stairs(tile_map)
-    log("Random ladders...")
-    generate_random_ladders(tile_map)
-    log("Walk graph...")
-    walk_graph = calculate_walk_graph(tile_map)
+def log_stage(event):
+    """Instrumentation sink logging the start of each stage of a map."""
+    if event['event'] == 'stage_start' and event['stage'] != 'map':
+        log("%s..." % event['stage'].replace('_', ' ').capitalize())
+
+instrumentation.sinks.append(log_stage)
+
+def main(argv=None):
+    global VERBOSE
+    parser = optparse.OptionParser(
+        usage="%prog [options]",
+        description="Generate a map and show it, or with --output-dir, "
+            "generate a batch of maps headlessly and write them to disk.")
+    parser.add_option('-s', '--seed', default=str(DEFAULT_SEED),
+        help="random seed, or an inclusive FIRST-LAST range of seeds (default %default)")
+    parser.add_option('-n', '--count', type='int', default=None,
+        help="number of consecutive seeds to generate, starting at --seed")
+    parser.add_option('-o', '--output-dir', default=None,
+        help="write maps to this directory instead of showing them")
+    parser.add_option('-f', '--format', default='text', choices=sorted(export.FORMATS),
+        help="output format: %s (default %%default)" % ', '.join(sorted(export.FORMATS)))
+    parser.add_option('-j', '--jobs', type='int', default=1,
+        help="number of processes to generate maps with, 0 for one per core (default %default)")
+    parser.add_option('-g', '--gates', action='store_true', default=False,
+        help="skip maps that fail the default quality gates")
+    parser.add_option('--gate', action='append', default=[], metavar='NAME=MIN:MAX',
+        help="skip maps whose NAME measure is outside MIN:MAX (either may be "
+            "blank); one of %s" % ', '.join(sorted(QUALITY_GATES)))
+    parser.add_option('-q', '--quiet', action='store_true', default=False,
+        help="don't log generation stages")
+    parser.add_option('--metrics', default=None, metavar='FILE',
+        help="write stage events, with hot path counters, to FILE as JSON lines")
+    parser.add_option('--profile', default=None, metavar='DIR',
+        help="profile each stage, writing <stage>.prof files to DIR")
+    options, args = parser.parse_args(argv)
+    if args:
+        parser.error("unexpected arguments: %s" % ' '.join(args))
+
+    gates = (dict(QUALITY_GATES) if options.gates else {})
+    for spec in options.gate:
+        name, sep, limits = spec.partition('=')
+        minimum, sep, maximum = limits.partition(':')
+        if name not in QUALITY_GATES or not sep:
+            parser.error("invalid gate: %s" % spec)
+        try:
+            gates[name] = (float(minimum) if minimum else None,
+                float(maximum) if maximum else None)
+        except ValueError:
+            parser.error("invalid gate: %s" % spec)
+
+    try:
+        seeds = parse_seeds(options.seed, options.count)
+    except ValueError:
+        parser.error("invalid seed: %s" % options.seed)
+    VERBOSE = not options.quiet
+    if (options.metrics or options.profile) and options.jobs != 1:
+        parser.error("--metrics and --profile only work with --jobs 1")
+
+    metrics = None
+    if options.metrics:
+        metrics = open(options.metrics, 'w')
+        instrumentation.sinks.append(JsonLinesSink(metrics))
+        instrumentation.enable_counting()
+    if options.profile:
+        instrumentation.enable_profiling()
+    try:
+        if options.output_dir is None:
+            if len(seeds) != 1:
+                parser.error("generating more than one map requires --output-dir")
+            if gates:
+                parser.error("quality gates require --output-dir")
+            show(seeds[0])
+        else:
+            generate_batch(seeds, options.output_dir, options.format,
+                jobs=options.jobs or None, gates=gates or None)
+    finally:
+        if metrics is not None:
+            instrumentation.disable_counting()
+            metrics.close()
+        if options.profile:
+            instrumentation.dump_profiles(options.profile)
+
+
+def parse_seeds(spec, count=None):
+    """Return the seeds given by `spec` (`SEED` or `FIRST-LAST`) and `count`."""
+    first, sep, last = spec.partition('-')
+    first = int(first)
+    if sep:
+        last = int(last)
+        if count is not None or last < first:
+            raise ValueError(spec)
+        return xrange(first, last + 1)
+    if count is None:
+        count = 1
+    return xrange(first, first + count)
+
+
+def generate(seed, width=TILE_MAP_WIDTH, height=TILE_MAP_HEIGHT, gates=None):
+    """
+    Generate a map from `seed`, returning `(tile_map, rooms, walk_graph)`.
+
+    If `gates` is given (a dict like `QUALITY_GATES`), the map is checked
+    against them after the stage each one measures, and `MapRejected`
+    is raised as soon as one fails.
+    """
+    with instrumentation.stage('map', seed=seed, width=width, height=height):
+        rng = random.Random(seed)
+        tile_map = TileMap(width=width, height=height)
+        kilotiles = width * height / 1000.0
+        with instrumentation.stage('rooms'):
+            rooms = generate_rooms(tile_map, rng=rng)
+        if gates:
+            small_area = 2 * ROOM_MINIMUM_WIDTH * ROOM_MINIMUM_HEIGHT
+            check_gates(gates,
+                room_density=len(rooms) / kilotiles,
+                small_rooms=float(sum(1 for room in rooms if room.width * room.height < small_area))
+                    / len(rooms))
+        for room in rooms:
+            room.track_tiles()
+        with instrumentation.stage('filled_rooms'):
+            for room in rooms:
+                generate_filled_room(room, rng=rng)
+        with instrumentation.stage('floors_and_ceilings'):
+            for room in rooms:
+                generate_floor_and_ceiling(room, rng=rng)
+        if gates:
+            # Answered from each room's tracked tile counts
+            solid = sum(room.count(is_tile(*SOLID_TILES)) for room in rooms)
+            check_gates(gates, fill=float(solid) / (width * height))
+        with instrumentation.stage('random_walls'):
+            for room in rooms:
+                generate_random_walls(room, rng=rng)
+        with instrumentation.stage('required_walls'):
+            for room in rooms:
+                generate_required_walls(room, left_hand=True, rng=rng)
+                generate_required_walls(room, left_hand=False, rng=rng)
+        # The room stages are done with the tile counts, so stop paying for
+        # them on every later write
+        for room in rooms:
+            room.untrack_tiles()
+        with instrumentation.stage('stairs'):
+            stair_count = generate_floor_stairs(tile_map, rng=rng)
+        if gates:
+            check_gates(gates, stair_density=stair_count / kilotiles)
+        with instrumentation.stage('random_ladders'):
+            ladder_count = generate_random_ladders(tile_map, rng=rng)
+        if gates:
+            check_gates(gates, ladder_density=ladder_count / kilotiles)
+        with instrumentation.stage('walk_graph'):
+            walk_graph = calculate_walk_graph(tile_map)
 
     # room_index = generate_room_index(rooms)
     # calculate_walkable(rooms)
 
-    tile_colors = {
-        TILE_EMPTY: '#000000',
-        TILE_FLOOR: '#333366',
-        TILE_CEILING: '#663333',
-        TILE_WALL: '#663366',
-        TILE_LADDER: '#ff6666',
-        TILE_STAIR: '#6666ff',
-        None: '',
-        }
-
-    gui = TileMapGUI(tile_map, tile_size, tile_colors, rooms=rooms, walk_graph=walk_graph)
+    return tile_map, rooms, walk_graph
+
+
+class MapRejected(Exception):
+    """Raised by `generate` when a map fails the quality gate `gate`,
+    with the measure `value` outside the `(minimum, maximum)` `limits`."""
+
+    def __init__(self, gate, value, limits):
+        super(MapRejected, self).__init__(gate, value, limits)
+        self.gate = gate
+        self.value = value
+        self.limits = limits
+
+    def __str__(self):
+        return "failed gate %s: %.3f not in %s:%s" % (self.gate, self.value,
+            '' if self.limits[0] is None else self.limits[0],
+            '' if self.limits[1] is None else self.limits[1])
+
+def check_gates(gates, **measures):
+    """Raise `MapRejected` if any of `measures` is outside its limits in
+    `gates`. Measures without a gate are not checked."""
+    for name, value in sorted(measures.items()):
+        if name not in gates:
+            continue
+        minimum, maximum = gates[name]
+        if ((minimum is not None and value < minimum)
+                or (maximum is not None and value > maximum)):
+            raise MapRejected(name, value, gates[name])
+
+
+def generate_to_file(seed, path, width, height, band_height=BAND_HEIGHT):
+    """
+    Generate a map from `seed` into a new `mapfile` at `path`, a band of
+    rows at a time (see `generate_in_bands`), returning the loaded map.
+
+    The map can be far bigger than memory. It has no rooms or walk graph
+    sections, as those are kept for the whole map.
+    """
+    import mapfile
+    loaded = mapfile.create(path, width, height, seed=seed,
+        params_hash=parameter_hash(), tile_names=TILE_NAMES)
+    generate_in_bands(loaded.tile_map, band_height, rng=random.Random(seed))
+    loaded.tile_map.storage.tiles.flush()
+    return loaded
+
+def generate_in_bands(tile_map, band_height=BAND_HEIGHT, rng=random):
+    """
+    Generate the tiles of `tile_map` a band of `band_height` rows at a
+    time, so the memory used depends on its width but not its height.
+
+    Each band is laid out as a map of its own, so no room crosses from
+    one band to the next. Stairs and ladders are then placed over the
+    whole map with `in_bands`.
+    """
+    def lay_out_band(band, rows, rng):
+        rooms = generate_rooms(band, rng=rng)
+        for room in rooms:
+            room.track_tiles()
+        for room in rooms:
+            generate_filled_room(room, rng=rng)
+        for room in rooms:
+            generate_floor_and_ceiling(room, rng=rng)
+        for room in rooms:
+            generate_random_walls(room, rng=rng)
+        for room in rooms:
+            generate_required_walls(room, left_hand=True, rng=rng)
+            generate_required_walls(room, left_hand=False, rng=rng)
+        for room in rooms:
+            room.untrack_tiles()
+
+    with instrumentation.stage('rooms_floors_and_walls'):
+        in_bands(tile_map, lay_out_band, band_height, rng=rng)
+    # Stairs look up to 3 tiles above where they start, and reach down
+    # to the floor up to STAIR_MAXIMUM_HEIGHT + 1 tiles below.
+    with instrumentation.stage('stairs'):
+        in_bands(tile_map, generate_floor_stairs, band_height,
+            above=3, below=STAIR_MAXIMUM_HEIGHT + 2, rng=rng)
+    # Ladders reach down LADDER_MAXIMUM_HEIGHT tiles, and must be spaced
+    # from those placed in the band above.
+    with instrumentation.stage('random_ladders'):
+        in_bands(tile_map, generate_random_ladders, band_height,
+            above=LADDER_MAXIMUM_HEIGHT + LADDER_VERTICAL_SPACE + 1,
+            below=LADDER_MAXIMUM_HEIGHT + 1, rng=rng)
+
+def in_bands(tile_map, stage, band_height, above=0, below=0, rng=random):
+    """
+    Run `stage(band, rng=rng, rows=(start, stop))` on each band of
+    `band_height` rows of `tile_map`, from the top down.
+
+    `band` is an in-memory copy of the band's rows, with up to `above`
+    and `below` rows of context either side, and `start` to `stop` are
+    the band's own rows within it. The stage's changes (to any rows of
+    `band`) are written back before the next band is copied.
+    """
+    height = tile_map.height
+    for y in range(0, height, band_height):
+        y0 = max(0, y - above)
+        y1 = min(height, y + band_height + below)
+        band = TileMap(width=tile_map.width, height=y1 - y0)
+        band[:, :] = tile_map[:, y0:y1]
+        stage(band, rng=rng, rows=(y - y0, min(height, y + band_height) - y0))
+        tile_map[:, y0:y1] = band
+
+def _clear_outside_rows(mask, width, rows):
+    """Clear the raster `mask` outside of `rows` (`(start, stop)`)."""
+    start, stop = rows
+    mask[:start * width] = bytearray(start * width)
+    mask[stop * width:] = bytearray(len(mask) - stop * width)
+
+
+def generate_batch(seeds, output_dir, format='text', jobs=1, gates=None):
+    """
+    Generate a map for each of `seeds`, writing each one to `output_dir`
+    as soon as it is finished (see `generate_encoded_maps`).
+
+    Return a dict of the number of maps rejected by each quality gate.
+    """
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    rejections = defaultdict(int)
+    for seed, encoded, report in generate_encoded_maps(seeds, format, jobs=jobs, gates=gates):
+        if encoded is None:
+            rejections[report.gate] += 1
+            log("Rejected map for seed %d: %s." % (seed, report))
+            continue
+        export.write_encoded(output_dir, seed, encoded)
+        log("Wrote map for seed %d: %s." % (seed, describe_summary(report)))
+    if gates:
+        log("Rejected %d of %d maps%s." % (sum(rejections.values()), len(seeds),
+            ''.join(', %d by %s' % (rejections[gate], gate) for gate in sorted(rejections))))
+    return dict(rejections)
+
+
+def generate_encoded_maps(seeds, format, jobs=1, gates=None):
+    """
+    Yield `(seed, encoded, report)` for each of `seeds` in order, where
+    `encoded` is the map generated from `seed` as returned by
+    `export.encode_map()`, and `report` is the summary of its walk
+    graph's `Connectivity`. If the map failed one of `gates` (see
+    `generate`), `encoded` is None and `report` is the `MapRejected`.
+
+    With `jobs` other than 1, maps are generated across a pool of that
+    many processes (one per core if None). Each map uses its own
+    `random.Random(seed)`, so the output is the same as a serial run.
+    """
+    tasks = ((seed, format, gates) for seed in seeds)
+    if jobs == 1:
+        for task in tasks:
+            yield _generate_encoded(task)
+        return
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for result in pool.imap(_generate_encoded, tasks):
+            yield result
+    finally:
+        pool.terminate()
+    pool.join()
+
+
+def _generate_encoded(task):
+    seed, format, gates = task
+    try:
+        tile_map, rooms, walk_graph = generate(seed, gates=gates)
+    except MapRejected as rejection:
+        return seed, None, rejection
+    encoded = export.encode_map(format, seed, tile_map, rooms, walk_graph,
+        tile_names=TILE_NAMES, params_hash=parameter_hash(), tile_colors=TILE_COLORS)
+    return seed, encoded, calculate_connectivity(tile_map, walk_graph).summary()
+
+def parameter_hash():
+    """Return a 64-bit hash of the generation parameters, so maps saved
+    with different parameters can be told apart."""
+    parameters = ['%s=%r' % (name, globals()[name]) for name in GENERATION_PARAMETERS]
+    digest = hashlib.sha1(','.join(parameters).encode('ascii')).digest()
+    return struct.unpack('<Q', digest[:8])[0]
+
+
+def show(seed):
+    """Generate a map from `seed` and show it in a window."""
+    from gui import TileMapGUI
+    tile_size = 8
+    print "random seed:", seed
+    tile_map, rooms, walk_graph = generate(seed)
+    gui = TileMapGUI(tile_map, tile_size, TILE_COLORS, rooms=rooms, walk_graph=walk_graph)
     gui.run()
 
 
-def generate_rooms(tile_map):
+def generate_rooms(tile_map, rng=random):
     # Recursively partition the tile map
     final_rooms = []
     current_rooms = [Room.clone(tile_map)]
@@ -119,18 +481,18 @@ def generate_rooms(tile_map):
             if not room_needs_split(room):
                 final_rooms.append(room)
             else:
-                split_x = (random.random() < ROOM_SPLIT_X_CHANCE)
+                split_x = (rng.random() < ROOM_SPLIT_X_CHANCE)
                 if not split_x and room.height >= 2 * ROOM_MINIMUM_HEIGHT:
                     # Split into top and bottom halves
                     split_start = ROOM_MINIMUM_HEIGHT
                     split_end = room.height - ROOM_MINIMUM_HEIGHT + 1
-                    y = random.randrange(split_start, split_end)
+                    y = rng.randrange(split_start, split_end)
                     new_rooms += list(room.split_y(y))
                 elif split_x and room.width >= 2 * ROOM_MINIMUM_WIDTH:
                     # Split into left and right halves
                     split_start = ROOM_MINIMUM_WIDTH
                     split_end = room.width - ROOM_MINIMUM_WIDTH + 1
-                    x = random.randrange(split_start, split_end)
+                    x = rng.randrange(split_start, split_end)
                     new_rooms += list(room.split_x(x))
                 else:
                     # Don't split this time
@@ -140,116 +502,149 @@ def generate_rooms(tile_map):
 
 
 def generate_room_index(rooms):
-    index = {}
-    for room in rooms:
-        for coord in Coord.range(room.tl, room.br):
-            index[coord] = room
-    return index
-
+    """Return a `RoomIndex` of the rooms partitioning their tile map."""
+    storage = rooms[0].storage
+    return RoomIndex(rooms, storage.width, storage.height)
+
+
+def calculate_walkable(tile_map):
+    """
+    Return a raster (see `raster.py`) of the coords that can be walked on.
+
+    A coord is walkable if it is above a floor/stair or on a ladder.
+    """
+    size = tile_map.width * tile_map.height
+    solid = raster.pack(tile_map.mask(is_tile(*SOLID_TILES)))
+    ladder = raster.pack(tile_map.mask(is_tile(TILE_LADDER)))
+    empty = raster.pack(tile_map.mask(is_tile(TILE_EMPTY)))
+    up_empty = raster.neighbour(empty, -tile_map.width, size)
+    up_ladder = raster.neighbour(ladder, -tile_map.width, size)
+    down_solid = raster.neighbour(solid, tile_map.width, size)
+    down_ladder = raster.neighbour(ladder, tile_map.width, size)
+    walkable = (
+        (up_empty
+            & empty
+            & down_solid)
+        | ((up_empty | up_ladder)
+            & ladder
+            & (down_ladder | down_solid)))
+    return raster.unpack(walkable, size)
+
+
+def calculate_walk_graph(tile_map, sources=None):
+    """
+    Return the `WalkGraph` of where you can walk to from the top left of
+    `tile_map`.
+
+    If `sources` is given, instead return the graph of just the edges from
+    each walkable coord in `sources`, without following them any further.
+
+    The search works in node ids (flat tile indices, `y * width + x`)
+    throughout, stepping to neighbours by fixed offsets, and only makes
+    `Coord`s for the coords given in `sources`.
+    """
+    width, height = tile_map.width, tile_map.height
+    size = width * height
+    tiles = tile_map.translate(IDENTITY_TABLE)
+    walkable = calculate_walkable(tile_map)
+    floors = tile_map.column_index(SOLID_TILES)
+    tl_x, tl_y = tile_map.tl
+    # Neighbour offsets
+    up, down, left, right = -width, width, -1, 1
 
-def calculate_walk_graph(tile_map):
     def find_top_left_empty():
-        empty_coords = tile_map.find(is_tile(TILE_EMPTY))
-        empty_coords = (coord for (coord, __) in empty_coords)
-        return reduce(closest_to(0, 0), empty_coords)
-    def is_solid(coord):
-        return (tile_map.get(coord) in SOLID_TILES)
-    def is_ladder(coord):
-        return (tile_map.get(coord) == TILE_LADDER)
-    def is_empty(coord):
-        return (tile_map.get(coord) == TILE_EMPTY)
-    def is_stair(coord):
-        return (tile_map.get(coord) == TILE_STAIR)
-
-    def find_floor(coord):
-        return tile_map.cast_until(coord, Coord(0, 1), is_tile(*SOLID_TILES))
-
-    # For each coord, store a boolean if it can be walked on
-    coord_is_walkable = defaultdict(lambda: False)
-    for coord in Coord.range((0, 0), (tile_map.width, tile_map.height)):
-        """A coord is walkable if it is above a floor/stair or on a ladder."""
-        up =  coord - Coord.Y
-        down = coord + Coord.Y
-        left = coord - Coord.X
-        right = coord + Coord.X
-
-        down_is_floor = is_solid(down)
-        down_is_ladder = is_ladder(down)
-        down_is_stair = is_stair(down)
-        up_is_empty = is_empty(up)
-        up_is_ladder = is_ladder(up)
-        tile_is_empty = is_empty(coord)
-        tile_is_ladder = is_ladder(coord)
-        coord_is_walkable[coord] = (
-            (up_is_empty
-                and tile_is_empty
-                and (down_is_floor or down_is_stair))
-            or ((up_is_empty or up_is_ladder)
-                and tile_is_ladder
-                and (down_is_ladder or down_is_floor)))
-
-    # For each coord, store a list of the coords you can walk to
-    coord_reachability = defaultdict(list)
-    # Start at the top left, just above the floor
-    start_coord = find_floor(find_top_left_empty()) - Coord(0, 1)
-    to_search = [start_coord]
+        """Return the node id of the empty tile closest to the top left."""
+        empty = tile_map.mask(is_tile(TILE_EMPTY))
+        closest = None
+        closest_distance = None
+        for y in range(height):
+            if closest is not None and y * y >= closest_distance:
+                break
+            x = empty.find(b'\x01', y * width, (y + 1) * width) - y * width
+            if x >= 0 and (closest is None or x * x + y * y < closest_distance):
+                closest = y * width + x
+                closest_distance = x * x + y * y
+        if closest is None:
+            raise ValueError("No empty tile to start from.")
+        return closest
+
+    def find_floor(node):
+        """Return the node id of the first solid tile at or below `node`."""
+        y, x = divmod(node, width)
+        floor_y = floors.below(x + tl_x, y + tl_y) - tl_y
+        if floor_y >= height:
+            raise ValueError("Coordinate matching predicate not found.")
+        return floor_y * width + x
+
+    def can_drop_to(side):
+        """Return the node id dropped to from beside a ledge at `side`, or
+        None if there's no drop there (or it's too far)."""
+        below = side + down
+        if tiles[side] != TILE_EMPTY or below >= size or tiles[below] != TILE_EMPTY:
+            return None
+        drop_to = find_floor(side) + up
+        if (drop_to - side) // width <= WALK_DROP_HEIGHT:
+            return drop_to
+        return None
+
+    # For each node id, a list of the node ids you can walk to (and how)
+    edges = {}
+    if sources is None:
+        # Start at the top left, just above the floor
+        start = find_floor(find_top_left_empty()) + up
+        to_search = [start]
+    else:
+        start = None
+        to_search = []
+        for x, y in sources:
+            if 0 <= x < width and 0 <= y < height:
+                to_search.append(y * width + x)
+        to_search.reverse()
+    follow_edges = (sources is None)
     while to_search:
-        coord = to_search.pop()
-        if not coord_is_walkable[coord]: continue
-        if coord in coord_reachability: continue
-        reachable = coord_reachability[coord]
-
-        up =  coord - Coord.Y
-        down = coord + Coord.Y
-        left = coord - Coord.X
-        right = coord + Coord.X
+        node = to_search.pop()
+        if not walkable[node]: continue
+        if node in edges: continue
+        reachable = edges[node] = []
+        x = node % width
 
         # Can always walk to neighbouring walkable coords
-        if coord_is_walkable[up]:
-            reachable.append(up)
-            to_search.append(up)
-        if coord_is_walkable[down]:
-            reachable.append(down)
-            to_search.append(down)
-        if coord_is_walkable[left]:
-            reachable.append(left)
-            to_search.append(left)
-        elif (is_stair(left) and coord_is_walkable[left - Coord.Y]):
-            reachable.append(left - Coord.Y)
-            to_search.append(left - Coord.Y)
-        else:
-            # Check if we can drop off an edge here
-            if is_empty(left) and is_empty(left + (0, 1)):
-                drop_to_coord = find_floor(left) - (0, 1)
-                if Coord.height(left, drop_to_coord) <= WALK_DROP_HEIGHT:
-                    reachable.append(drop_to_coord)
-                    to_search.append(drop_to_coord)
-        if coord_is_walkable[right]:
-            reachable.append(right)
-            to_search.append(right)
-        elif (is_stair(right) and coord_is_walkable[right - Coord.Y]):
-            reachable.append(right - Coord.Y)
-            to_search.append(right - Coord.Y)
-        else:
-            # Check if we can drop off an edge here
-            if is_empty(right) and is_empty(right + (0, 1)):
-                drop_to_coord = find_floor(right) - (0, 1)
-                if Coord.height(right, drop_to_coord) <= WALK_DROP_HEIGHT:
-                    reachable.append(drop_to_coord)
-                    to_search.append(drop_to_coord)
+        if node >= width and walkable[node + up]:
+            reachable.append((node + up, LADDER))
+        if node + down < size and walkable[node + down]:
+            reachable.append((node + down, LADDER))
+        for side, at_edge in ((node + left, x == 0), (node + right, x == width - 1)):
+            if at_edge:
+                continue
+            if walkable[side]:
+                reachable.append((side, WALK))
+            elif (tiles[side] == TILE_STAIR and side >= width and walkable[side + up]):
+                reachable.append((side + up, STAIR))
+            else:
+                # Check if we can drop off an edge here
+                drop_to = can_drop_to(side)
+                if drop_to is not None:
+                    reachable.append((drop_to, DROP))
+        if follow_edges:
+            to_search.extend(other for (other, kind) in reachable)
+
+    return WalkGraph.from_edges(width, height, edges, start)
 
-    return coord_reachability
+def calculate_connectivity(tile_map, walk_graph):
+    """Return the `Connectivity` of `walk_graph`, relative to all the
+    walkable tiles of `tile_map`."""
+    return Connectivity(walk_graph, calculate_walkable(tile_map).count(b'\x01'))
 
-def generate_filled_room(room):
+def generate_filled_room(room, rng=random):
     if room.width > FILLED_MAXIMUM_WIDTH or room.height > FILLED_MAXIMUM_HEIGHT:
         return
-    fill = (random.random() < FILLED_CHANCE)
+    fill = (rng.random() < FILLED_CHANCE)
     if not fill:
         return
     room.fill(TILE_WALL)
 
 
-def generate_floor_and_ceiling(room):
+def generate_floor_and_ceiling(room, rng=random):
     """Find a random height for the floor that still allows the minimum walkable space."""
     if room.is_filled():
         return
@@ -258,8 +653,8 @@ def generate_floor_and_ceiling(room):
     ceiling_max = min(room.height - FLOOR_MINIMUM - FLOOR_TO_CEILING_MINIMUM, CEILING_MAXIMUM)
 
     while True:
-        floor_height = random.randrange(FLOOR_MINIMUM, floor_max + 1)
-        ceiling_height = random.randrange(CEILING_MINIMUM, ceiling_max + 1)
+        floor_height = rng.randrange(FLOOR_MINIMUM, floor_max + 1)
+        ceiling_height = rng.randrange(CEILING_MINIMUM, ceiling_max + 1)
         if room.height - ceiling_height - floor_height >= FLOOR_TO_CEILING_MINIMUM:
             break
     room.floor_height = floor_height
@@ -268,18 +663,18 @@ def generate_floor_and_ceiling(room):
     room.ceiling_subview().fill(TILE_CEILING)
 
 
-def generate_random_walls(room):
+def generate_random_walls(room, rng=random):
     """Decide whether to place walls."""
     if room.is_filled():
         return
 
-    wall = (random.random() < WALL_CHANCE)
-    left_hand = (random.random() < 0.5)
+    wall = (rng.random() < WALL_CHANCE)
+    left_hand = (rng.random() < 0.5)
 
     # Determine wall size
     other_wall_width = (room.right_wall_width if left_hand else room.left_wall_width)
     max_width = min(room.width - WALL_MINIMUM - other_wall_width, WALL_MAXIMUM)
-    wall_width = random.randrange(WALL_MINIMUM, max_width)
+    wall_width = rng.randrange(WALL_MINIMUM, max_width)
 
     # Create the wall (if there isn't one already)
     if wall:
@@ -291,7 +686,7 @@ def generate_random_walls(room):
             room.right_wall_width = wall_width
 
 
-def generate_required_walls(room, left_hand=False):
+def generate_required_walls(room, left_hand=False, rng=random):
     """Place required walls."""
     if room.is_filled():
         return
@@ -301,7 +696,7 @@ def generate_required_walls(room, left_hand=False):
     # Determine wall size
     other_wall_width = (room.right_wall_width if left_hand else room.left_wall_width)
     max_width = min(room.width - WALL_MINIMUM - other_wall_width, WALL_MAXIMUM)
-    wall_width = random.randrange(WALL_MINIMUM, max_width)
+    wall_width = rng.randrange(WALL_MINIMUM, max_width)
 
     # Check if a wall should be forced
     edge = (0 if left_hand else room.width - 1)
@@ -328,39 +723,58 @@ def generate_required_walls(room, left_hand=False):
             room[room.width - wall_width:,:] = TILE_WALL
             room.right_wall_width = wall_width
 
-def generate_floor_stairs(tile_map):
-    """Place stairs to join uneven floor levels."""
+def generate_floor_stairs(tile_map, rng=random, rows=None):
+    """Place stairs to join uneven floor levels, returning the number of
+    stair locations found.
+
+    If `rows` is given as `(start, stop)`, only place stairs that start
+    in those rows (the rest of `tile_map` is context; see `in_bands`).
+    """
     SOLID_EXCEPT_STAIRS = SOLID_TILES - set([TILE_STAIR])
     def is_solid(coord):
         return (tile_map.get(coord) in SOLID_EXCEPT_STAIRS)
     def is_empty(coord):
         return (tile_map.get(coord) == TILE_EMPTY)
-    def is_empty_above(coord, height):
-        for y in range(1, height + 1):
-            if not is_empty(coord - (0, y)):
-                return False
-        return True
     def to_floor(coord):
         return tile_map.cast_until(coord, Coord(0, 1), is_tile(*SOLID_EXCEPT_STAIRS))
-    def height_above_floor(coord):
-        return Coord.height(coord, to_floor(coord))
-    def wall_height(coord):
-        try:
-            bottom_coord = tile_map.cast_until(coord, Coord(0, 1), is_not(is_tile(*SOLID_EXCEPT_STAIRS)))
-        except ValueError:
-            bottom_coord = Coord(coord.x, tile_map.height)
-        return Coord.height(coord, bottom_coord)
-    def get_stair_direction(coord):
-        left = coord - Coord.X
-        right = coord + Coord.X
-        if is_solid(left) and is_empty(right):
-            return Coord.X
-        elif is_empty(left) and is_solid(right):
-            return -Coord.X
+
+    # The stair location checks read the storage by flat index, as they
+    # try every candidate and must see the stairs placed so far
+    view_width, view_height = tile_map.width, tile_map.height
+    tiles = tile_map.storage.tiles
+    origin = tile_map._local_to_index(0, 0)
+    # Neighbour offset
+    up = -tile_map.storage.width
+    tl_x, tl_y = tile_map.tl
+    floor_index = tile_map.column_index(SOLID_EXCEPT_STAIRS)
+
+    def tile_at(x, y):
+        if 0 <= x < view_width and 0 <= y < view_height:
+            return tiles[origin - up * y + x]
+        return None
+    def is_empty_above(x, y, height):
+        if y < height:
+            return False
+        i = origin - up * y + x
+        for step in range(1, height + 1):
+            if tiles[i + up * step] != TILE_EMPTY:
+                return False
+        return True
+    def height_above_floor(x, y):
+        return min(floor_index.below(x + tl_x, y + tl_y) - tl_y, view_height) - y
+    def wall_height(x, y):
+        return min(floor_index.run_end(x + tl_x, y + tl_y) - tl_y, view_height) - y
+    def get_stair_direction(x, y):
+        left = tile_at(x - 1, y)
+        right = tile_at(x + 1, y)
+        if left in SOLID_EXCEPT_STAIRS and right == TILE_EMPTY:
+            return 1
+        elif left == TILE_EMPTY and right in SOLID_EXCEPT_STAIRS:
+            return -1
         else:
             return None
 
-    def is_stair_location(tile_map, stair_start):
+    def is_stair_location(x, y):
         """A stair location is one like:
 
           - E E E - -     E: empty
@@ -369,64 +783,100 @@ def generate_floor_stairs(tile_map):
           = W f s E -     f: backfill for stair, initially empty
           = W W W[W]=     =/-: don't care
 
-        stair_start is `[s]`, stair_end is `[W]`.
+        The stair start `[s]` is (x, y), the stair end is `[W]`.
 
-        Return `stair_end` coordinate if can place a stair starting
-        at `coord`, or False if not.
+        Return the `(x, y)` of the stair end if can place a stair
+        starting at (x, y), or False if not.
         """
-        if not is_empty(stair_start): return False
-        if not is_empty_above(stair_start, 2): return False
-        stair_direction = get_stair_direction(stair_start)
+        if tile_at(x, y) != TILE_EMPTY: return False
+        if not is_empty_above(x, y, 2): return False
+        stair_direction = get_stair_direction(x, y)
         if stair_direction is None: return False
-        wall_direction = -stair_direction
-        wall_coord = stair_start + wall_direction
+        wall_x = x - stair_direction
 
         # Ensure the stair is not too high
-        stair_height = height_above_floor(stair_start)
+        stair_height = height_above_floor(x, y)
         if stair_height > STAIR_MAXIMUM_HEIGHT: return False
         # Ensure there is standing room above the wall
-        if not is_empty_above(wall_coord, 2): return False
+        if not is_empty_above(wall_x, y, 2): return False
         # Ensure there is wall all the way down
-        if wall_height(wall_coord) < stair_height: return False
+        if wall_height(wall_x, y) < stair_height: return False
         # Then, moving diagonally down and right until hit floor:
         height = stair_height
-        step_coord = stair_start
+        step_x, step_y = x, y
         while height > 1:
             height -= 1
-            step_coord += (stair_direction + (0, 1))
+            step_x += stair_direction
+            step_y += 1
             # Ensure the spot is empty
-            if not is_empty(step_coord): return False
+            if tile_at(step_x, step_y) != TILE_EMPTY: return False
             # Ensure there is standing room + 1 above
-            if not is_empty_above(step_coord, 3): return False
+            if not is_empty_above(step_x, step_y, 3): return False
             # Ensure there is space - n below before a floor
-            if height_above_floor(step_coord) != height: return False
-        stair_end = step_coord + (stair_direction + (0, 1))
+            if height_above_floor(step_x, step_y) != height: return False
+        end_x, end_y = step_x + stair_direction, step_y + 1
         # Check the floor where the stair ends
-        if not is_solid(stair_end): return False
-        if not is_empty_above(stair_end, 3): return False
-        return stair_end
+        if tile_at(end_x, end_y) not in SOLID_EXCEPT_STAIRS: return False
+        if not is_empty_above(end_x, end_y, 3): return False
+        return (end_x, end_y)
+
+    def find_stair_candidates():
+        """Return a raster of the coords that may be stair locations.
 
-    stairs = []
-    for stair_start, stair_end in tile_map.find(is_stair_location):
-        should_make_stair = (random.random() < STAIR_CHANCE)
+        A stair location is always empty, with empty above, beside the top
+        of a wall or floor that is at its own height. Placing a stair never
+        adds to these, so the raster can be found once, up front.
+        """
+        size = tile_map.width * tile_map.height
+        solid = raster.pack(tile_map.mask(is_tile(*SOLID_EXCEPT_STAIRS)))
+        empty = raster.pack(tile_map.mask(is_tile(TILE_EMPTY)))
+        up_empty = raster.neighbour(empty, -tile_map.width, size)
+        solid_tops = solid & up_empty
+        candidates = (
+            (raster.neighbour(solid_tops, -1, size) | raster.neighbour(solid_tops, 1, size))
+            & empty
+            & up_empty)
+        return raster.unpack(candidates, size)
+
+    candidates = find_stair_candidates()
+    if rows is not None:
+        _clear_outside_rows(candidates, tile_map.width, rows)
+    location_count = 0
+    node = candidates.find(b'\x01')
+    while node != -1:
+        y, x = divmod(node, tile_map.width)
+        node = candidates.find(b'\x01', node + 1)
+        stair_end = is_stair_location(x, y)
+        if not stair_end: continue
+        location_count += 1
+        should_make_stair = (rng.random() < STAIR_CHANCE)
         if not should_make_stair: continue
 
-        step = Coord(
-            1 if (stair_end.x > stair_start.x) else -1,
-            1 if (stair_end.y > stair_start.y) else -1)
-        coord = stair_start
+        step = Coord(1 if (stair_end[0] > x) else -1, 1 if (stair_end[1] > y) else -1)
+        coord = Coord(x, y)
+        floors = []
+        steps = []
         while is_empty(coord):
             floor_coord = to_floor(coord)
-            tile_map[coord:(floor_coord + Coord.X)] = TILE_FLOOR
-            tile_map[coord] = TILE_STAIR
+            floors.append((coord, floor_coord + Coord.X))
+            steps.append((coord, coord + Coord.X + Coord.Y))
             coord += step
+        tile_map.paint(floors, TILE_FLOOR)
+        tile_map.paint(steps, TILE_STAIR)
+    return location_count
 
-def generate_random_ladders(tile_map):
-    """Place random ladders."""
+def generate_random_ladders(tile_map, rng=random, rows=None):
+    """Place random ladders, spaced out from each other and from any
+    ladders already in `tile_map`, returning the number of ladder
+    positions found.
 
-    def can_place_ladder(tile_map, ladder_start):
-        """Return a `ladder_end` coordinate if a ladder can be placed
-        starting at `coord`, or `False` if it cannot.
+    If `rows` is given as `(start, stop)`, only place ladders that start
+    in those rows (the rest of `tile_map` is context; see `in_bands`).
+    """
+
+    def find_ladder_locations():
+        """Return a list of `(ladder_start, ladder_end)` for every place
+        a ladder can be placed, in row-major order of `ladder_start`.
 
               ladder_start
                     |
@@ -438,72 +888,82 @@ def generate_random_ladders(tile_map):
                            ^
                            |
                        ladder_end
+
+        Each row of every 3-wide window is classed as all empty (E), all
+        solid (S) or mixed (M), and ladder spans are matched in the
+        column of classes for each window.
         """
-        if ladder_start.x < 1 or ladder_start.x >= tile_map.width - 2: return False
-        if ladder_start.y < 0 or ladder_start.y >= tile_map.height - 1: return False
-
-        tl = Coord(ladder_start.x - 1, ladder_start.y)
-        br = Coord(ladder_start.x + 2, tile_map.height)
-        subview = tile_map[tl:br]
-
-        def is_empty_line(y):
-            if y >= subview.height: return False
-            for x in range(subview.width):
-                if subview[x, y] != TILE_EMPTY:
-                    return False
-            return True
-        def is_solid_line(y):
-            if y >= subview.height: return False
-            for x in range(subview.width):
-                if subview[x, y] not in (TILE_WALL, TILE_FLOOR, TILE_CEILING):
-                    return False
-            return True
-
-        empty_lines_above = 0
-        solid_lines_above = 0
-        empty_lines_below = 0
-        solid_lines_below = 0
-        y = 0
-        while is_empty_line(y):
-            empty_lines_above += 1
-            y += 1
-        if empty_lines_above != 1: return False
-        while is_solid_line(y):
-            solid_lines_above += 1
-            y += 1
-        if solid_lines_above < 1: return False
-        while is_empty_line(y):
-            empty_lines_below += 1
-            y += 1
-        if empty_lines_below < LADDER_MINIMUM_HEIGHT: return False
-        if is_solid_line(y):
-            solid_lines_below += 1
-        if solid_lines_below != 1: return False
-
-        ladder_end = Coord(subview.width - 1, y)
-        ladder_end = subview.to_other(ladder_end, tile_map)
-        if Coord.height(ladder_start, ladder_end) > LADDER_MAXIMUM_HEIGHT: return False
-
-        return ladder_end
-
-    ladders = list(tile_map.find(can_place_ladder))
+        width, height = tile_map.width, tile_map.height
+        size = width * height
+        classes = bytearray(256)
+        classes[TILE_EMPTY] = 1
+        for tile in (TILE_WALL, TILE_FLOOR, TILE_CEILING):
+            classes[tile] = 2
+        classes = raster.pack(tile_map.translate(classes))
+        # A window is all empty/solid where it and both its neighbours are
+        windows = (classes
+            & raster.neighbour(classes, -1, size)
+            & raster.neighbour(classes, 1, size))
+        windows = raster.unpack(windows, size).translate(LADDER_WINDOW_CLASSES)
+        pattern = re.compile(('(?=(ES+E{%d,}S))' % LADDER_MINIMUM_HEIGHT).encode('ascii'))
+
+        start_row, stop_row = (rows if rows is not None else (0, height))
+        ladders = []
+        for x in range(1, width - 2):
+            for match in pattern.finditer(bytes(windows[x::width])):
+                start_y = match.start(1)
+                end_y = match.end(1) - 1
+                if end_y - start_y > LADDER_MAXIMUM_HEIGHT: continue
+                if not start_row <= start_y < stop_row: continue
+                ladders.append((Coord(x, start_y), Coord(x + 1, end_y)))
+        ladders.sort(key=lambda ladder: (ladder[0].y, ladder[0].x))
+        return ladders
+
+    ladders = find_ladder_locations()
     ladder_count = int(round(float(len(ladders)) * LADDER_DENSITY))
 
-    while ladder_count and ladders:
-        # Find a ladder position and build it
-        ladder = random.choice(ladders)
-        ladder_start, ladder_end = ladder
-        tile_map[ladder_start:ladder_end] = TILE_LADDER
-        # Remove all overlapping ladder positions
-        def does_not_overlap(other_ladder):
-            overlaps = (ladder_start[0] - LADDER_HORIZONTAL_SPACE < other_ladder[1][0]
+    # Bucket the ladder positions in a grid, so that only those in nearby
+    # cells need checking for overlaps when a ladder is placed
+    cell_width = LADDER_HORIZONTAL_SPACE + 1
+    cell_height = LADDER_VERTICAL_SPACE + LADDER_MAXIMUM_HEIGHT + 1
+    def cells(tl, br):
+        """Return the grid cells covering `tl` to `br` inclusive."""
+        return [(cell_x, cell_y)
+            for cell_y in range(tl[1] // cell_height, br[1] // cell_height + 1)
+            for cell_x in range(tl[0] // cell_width, br[0] // cell_width + 1)]
+    buckets = defaultdict(list)
+    for i, (other_start, other_end) in enumerate(ladders):
+        for cell in cells(other_start, other_end):
+            buckets[cell].append(i)
+    remaining_ladders = RemovableSequence(ladders)
+
+    def remove_overlapping(ladder_start, ladder_end):
+        """Remove all ladder positions overlapping a ladder from
+        `ladder_start` to `ladder_end`."""
+        def overlaps(other_ladder):
+            return (ladder_start[0] - LADDER_HORIZONTAL_SPACE < other_ladder[1][0]
                 and ladder_end[0] + LADDER_HORIZONTAL_SPACE > other_ladder[0][0]
                 and ladder_start[1] - LADDER_VERTICAL_SPACE < other_ladder[1][1]
                 and ladder_end[1] + LADDER_VERTICAL_SPACE > other_ladder[0][1])
-            return not overlaps
 
-        ladders = filter(does_not_overlap, ladders)
+        space = Coord(LADDER_HORIZONTAL_SPACE, LADDER_VERTICAL_SPACE)
+        for cell in cells(ladder_start - space, ladder_end + space):
+            for i in buckets.get(cell, ()):
+                if overlaps(ladders[i]):
+                    remaining_ladders.remove(i)
+
+    for coord in tile_map.find_mask(is_tile(TILE_LADDER)):
+        if remaining_ladders:
+            remove_overlapping(coord, coord + (1, 1))
+
+    while ladder_count and remaining_ladders:
+        # Find a ladder position and build it
+        ladder = rng.choice(remaining_ladders)
+        ladder_start, ladder_end = ladder
+        tile_map[ladder_start:ladder_end] = TILE_LADDER
+        remove_overlapping(ladder_start, ladder_end)
         ladder_count -= 1
+    return len(ladders)
 
 
 class Room(TileMap):
@@ -521,9 +981,7 @@ class Room(TileMap):
         return self[:,:self.ceiling_height]
 
     def is_filled(self):
-        for coord, __ in self.find(is_not(is_tile(*SOLID_TILES))):
-            return False
-        return True
+        return self.all(is_tile(*SOLID_TILES))
 
 if __name__ == '__main__':
     main()
@@ -1,11 +1,16 @@
 #!/usr/local/bin/python
 import Tkinter
+from collections import defaultdict
 from color import ColorGenerator
 from itertools import izip
 from tilemap import *
 
 __all__ = ('TileMapGUI',)
 
+# Size in tiles of the cells walk graph edges are bucketed into, to find
+# those near the view
+WALK_GRAPH_CELL_SIZE = 16
+
 class TileMapGUI(object):
     def __init__(self, tile_map, tile_size, tile_colors, rooms=None, walk_graph=None, tk=None):
         self.tk = tk or root_tk
@@ -17,10 +22,11 @@ class TileMapGUI(object):
         self.height = self.tile_size_y * tile_map.height
         self.view_width = 640        # tk.winfo_screenwidth()
         self.view_height = 512       # tk.winfo_screenheight()
+        self.background = '#ffffff'
         self.canvas = Tkinter.Canvas(self.tk,
             width=self.view_width,
             height=self.view_height,
-            bg='white',
+            bg=self.background,
             scrollregion=(0, 0, self.width, self.height),
             xscrollincrement=5,
             yscrollincrement=5)
@@ -29,6 +35,7 @@ class TileMapGUI(object):
         self.canvas.bind('<B1-Motion>', self.drag)
         self.canvas.bind('<MouseWheel>', self.scroll)
         self.canvas.bind('<KeyPress>', self.keypress)
+        self.walk_graph = None
         self.create_tile_map(tile_map)
         if rooms:
             self.create_rooms(rooms)
@@ -38,31 +45,61 @@ class TileMapGUI(object):
         self.canvas.focus_set()
 
     def create_tile_map(self, tile_map):
+        """Draw `tile_map` as a single image, with a block of pixels per tile."""
         self.tile_map = tile_map.copy()
-        self.tile_objects = []
-        for y in range(self.tile_map.height):
-            row = []
-            for x in range(self.tile_map.width):
-                tile = self.canvas.create_rectangle(
-                    x * self.tile_size_x,
-                    y * self.tile_size_y,
-                    (x + 1) * self.tile_size_x,
-                    (y + 1) * self.tile_size_y,
-                    fill='',
-                    outline='',
-                    tags='tile')
-                row.append(tile)
-            self.tile_objects.append(row)
-        self.update_tile_map()
+        # Image data for a tile's row of pixels, for each tile value
+        default_color = self.tile_colors[None] or self.background
+        self.tile_pixels = []
+        for value in range(256):
+            color = self.tile_colors.get(value, default_color) or self.background
+            self.tile_pixels.append(' '.join([color] * self.tile_size_x))
+        self.tile_image = Tkinter.PhotoImage(width=self.width, height=self.height)
+        self.canvas.create_image(0, 0, image=self.tile_image, anchor=Tkinter.NW, tags='tile')
+        # Edits to the map mark the rectangles they change as dirty, and
+        # the next redraw paints just those
+        self.dirty_rects = []
+        self.redraw_pending = False
+        self.tile_map.storage.watchers.append(self)
+        self.paint_tiles(0, 0, self.tile_map.width, self.tile_map.height)
+
+    def paint_tiles(self, x0, y0, x1, y1):
+        """Paint the tiles from (x0, y0) to (x1, y1) onto the image, a row of tiles at a time."""
+        tile_pixels = self.tile_pixels
+        rect = self.tile_map.subview(tl=Coord(x0, y0), br=Coord(x1, y1))
+        for y, row in enumerate(rect.rows(), y0):
+            data = '{%s}' % ' '.join([tile_pixels[value] for value in row])
+            # A single row of pixels is repeated down the whole row of tiles
+            self.tile_image.put(data, to=(
+                x0 * self.tile_size_x, y * self.tile_size_y,
+                x1 * self.tile_size_x, (y + 1) * self.tile_size_y))
 
     def update_tile_map(self):
-        default_color = self.tile_colors[None]
-        for y in range(self.tile_map.height):
-            for x in range(self.tile_map.width):
-                value = self.tile_map[x,y]
-                tile = self.tile_objects[y][x]
-                color = self.tile_colors.get(value, default_color)
-                self.canvas.itemconfig(tile, fill=color)
+        """Repaint the tiles changed since the last update."""
+        self.redraw_pending = False
+        dirty_rects, self.dirty_rects = self.dirty_rects, []
+        if len(dirty_rects) > 32:
+            # Cheaper to paint everything in one go than rect by rect
+            dirty_rects = [(min(rect[0] for rect in dirty_rects), min(rect[1] for rect in dirty_rects),
+                max(rect[2] for rect in dirty_rects), max(rect[3] for rect in dirty_rects))]
+        for x0, y0, x1, y1 in dirty_rects:
+            self.paint_tiles(x0, y0, x1, y1)
+
+    def tiles_changing(self, x0, y0, x1, y1):
+        pass
+
+    def tiles_changed(self, x0, y0, x1, y1):
+        # Storage to map coordinates, clipped to the map
+        tl = self.tile_map.tl
+        x0 = max(x0 - tl.x, 0)
+        y0 = max(y0 - tl.y, 0)
+        x1 = min(x1 - tl.x, self.tile_map.width)
+        y1 = min(y1 - tl.y, self.tile_map.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        self.dirty_rects.append((x0, y0, x1, y1))
+        if not self.redraw_pending:
+            self.redraw_pending = True
+            self.tk.after_idle(self.update_tile_map)
 
     def create_rooms(self, rooms):
         self.rooms = list(rooms)
@@ -82,30 +119,88 @@ class TileMapGUI(object):
             self.room_objects.append(rect)
 
     def create_walk_graph(self, walk_graph):
-        self.walk_graph = walk_graph.copy()
-        two_way_line_options = dict(
-            fill='#00ff00',
-            width=2,
-            tags='walk_graph')
-        one_way_line_options = dict(
-            fill='#ff0000',
-            width=2,
-            tags='walk_graph')
-        def tile_center(coord):
-            return [(coord.x + 0.5) * self.tile_size_x, (coord.y + 0.5) * self.tile_size_x]
-        for y in range(self.tile_map.height):
-            for x in range(self.tile_map.width):
-                coord = Coord(x, y)
-                can_reach = walk_graph.get(coord)
-                if not can_reach: continue
-                for other_coord in can_reach:
-                    two_way = (coord in walk_graph.get(other_coord, []))
-                    if two_way:
-                        self.canvas.create_line(*(tile_center(coord) + tile_center(other_coord)),
-                            **two_way_line_options)
-                    else:
-                        self.canvas.create_line(*(tile_center(coord) + tile_center(other_coord)),
-                            **one_way_line_options)
+        """
+        Overlay the edges of `walk_graph`, two-way edges in green and one-way
+        edges in red.
+
+        Only the edges in and around the visible part of the map are drawn,
+        joined into as few polylines per class as possible, and redrawn when
+        the view moves past them.
+        """
+        self.walk_graph = walk_graph
+        self.walk_graph_shown = True
+        self.walk_graph_region = None
+        # Each edge under the cells of both of its ends, as (two_way, node, target)
+        self.walk_graph_cells = defaultdict(list)
+        width = walk_graph.width
+        cell_size = WALK_GRAPH_CELL_SIZE
+        nodes = walk_graph.nodes
+        node = nodes.find(b'\x01')
+        while node != -1:
+            for target in walk_graph.neighbor_ids(node):
+                two_way = node in walk_graph.neighbor_ids(target)
+                if two_way and target < node:
+                    # Drawn from the other end
+                    continue
+                edge = (two_way, node, target)
+                cells = set()
+                for end in (node, target):
+                    y, x = divmod(end, width)
+                    cells.add((x // cell_size, y // cell_size))
+                for cell in cells:
+                    self.walk_graph_cells[cell].append(edge)
+            node = nodes.find(b'\x01', node + 1)
+        self.update_walk_graph()
+
+    def visible_tiles(self):
+        """Return the (x0, y0, x1, y1) tiles in view."""
+        x = self.canvas.canvasx(0)
+        y = self.canvas.canvasy(0)
+        return (int(x // self.tile_size_x), int(y // self.tile_size_y),
+            int((x + self.view_width) // self.tile_size_x) + 1,
+            int((y + self.view_height) // self.tile_size_y) + 1)
+
+    def update_walk_graph(self):
+        """Draw the walk graph around the view, if it has moved out of the region drawn."""
+        if not self.walk_graph_shown:
+            return
+        x0, y0, x1, y1 = self.visible_tiles()
+        region = self.walk_graph_region
+        if region and region[0] <= x0 and region[1] <= y0 and x1 <= region[2] and y1 <= region[3]:
+            return
+        # Draw a view's width and height beyond each side, so that small
+        # moves don't need a redraw
+        margin_x = x1 - x0
+        margin_y = y1 - y0
+        region = (x0 - margin_x, y0 - margin_y, x1 + margin_x, y1 + margin_y)
+        self.walk_graph_region = region
+
+        cell_size = WALK_GRAPH_CELL_SIZE
+        edges = set()
+        for cell_y in range(max(region[1], 0) // cell_size, max(region[3], 0) // cell_size + 1):
+            for cell_x in range(max(region[0], 0) // cell_size, max(region[2], 0) // cell_size + 1):
+                edges.update(self.walk_graph_cells.get((cell_x, cell_y), ()))
+        self.canvas.delete('walk_graph')
+        for two_way, color in ((True, '#00ff00'), (False, '#ff0000')):
+            class_edges = [(node, target) for (edge_two_way, node, target) in edges
+                if edge_two_way == two_way]
+            for trail in _trails(class_edges):
+                points = []
+                for node in trail:
+                    y, x = divmod(node, self.walk_graph.width)
+                    points.append((x + 0.5) * self.tile_size_x)
+                    points.append((y + 0.5) * self.tile_size_y)
+                self.canvas.create_line(*points, fill=color, width=2, tags='walk_graph')
+        self.canvas.tag_raise('grid')
+
+    def toggle_walk_graph(self):
+        """Show or hide the walk graph overlay."""
+        self.walk_graph_shown = not self.walk_graph_shown
+        if self.walk_graph_shown:
+            self.canvas.itemconfigure('walk_graph', state=Tkinter.NORMAL)
+            self.update_walk_graph()
+        else:
+            self.canvas.itemconfigure('walk_graph', state=Tkinter.HIDDEN)
 
     def create_grid(self, grid_size_x, grid_size_y):
         grid_coords = []
@@ -147,16 +242,24 @@ class TileMapGUI(object):
 
     def drag(self, event):
         self.canvas.scan_dragto(event.x, event.y, gain=1)
+        self.view_moved()
 
     def scroll(self, event):
         if event.state == 0:
             self.canvas.yview(Tkinter.SCROLL, -event.delta, Tkinter.UNITS)
         elif event.state == 1:
             self.canvas.xview(Tkinter.SCROLL, -event.delta, Tkinter.UNITS)
+        self.view_moved()
+
+    def view_moved(self):
+        if self.walk_graph is not None:
+            self.update_walk_graph()
 
     def keypress(self, event):
         if event.keysym == 'Escape':
             self.tk.destroy()
+        elif event.keysym == 'w' and self.walk_graph is not None:
+            self.toggle_walk_graph()
 
     def run(self):
         self.tk.mainloop() 
@@ -186,6 +289,36 @@ class TileMapGUI(object):
             }
         subprocess.call(['/usr/bin/osascript', '-e', script])
 
+def _trails(edges):
+    """
+    Return a list of trails (lists of node ids) that together cover each
+    of `edges` (pairs of node ids) once, so that each can be drawn as one
+    polyline. Trails start from nodes with an odd number of edges where
+    possible, which keeps them few.
+    """
+    adjacency = defaultdict(list)
+    for node, target in edges:
+        adjacency[node].append(target)
+        adjacency[target].append(node)
+    used = set()
+    starts = ([node for node in adjacency if len(adjacency[node]) % 2]
+        + [node for node in adjacency if not len(adjacency[node]) % 2])
+    trails = []
+    for start in starts:
+        node = start
+        trail = [node]
+        while adjacency[node]:
+            target = adjacency[node].pop()
+            edge = (min(node, target), max(node, target))
+            if edge in used:
+                continue
+            used.add(edge)
+            trail.append(target)
+            node = target
+        if len(trail) > 1:
+            trails.append(trail)
+    return trails
+
 # Set up global `root_tk` and `root_process_id` variables
 _process_ids = TileMapGUI.process_ids()
 root_tk = Tkinter.Tk()
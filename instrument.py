@@ -0,0 +1,241 @@
+__all__ = ('COUNTERS', 'Instrumentation', 'JsonLinesSink', 'instrumentation')
+
+import cProfile, json, os, time
+import tilemap
+from tilemap import Coord, TileMap, TileMapStorage
+
+# Hot path counters, kept while counting is enabled
+COUNTERS = (
+    'find_predicate_calls',
+    'cast_until_calls',
+    'cast_until_steps',
+    'tiles_written',
+    'coords_created',
+    )
+
+_MISSING = object()
+
+
+class Instrumentation(object):
+    """
+    Stage events, hot path counters and per-stage profiles for map
+    generation.
+
+    Each `stage(name)` block sends a `stage_start` and a `stage_end`
+    event (a dict) to every callable in `sinks`, the end event with its
+    `duration` in seconds and, while counting, the `counters` it changed.
+
+    Counting and profiling are off until enabled. Counting works by
+    replacing the counted methods of `TileMap`, `TileMapStorage` and
+    `Coord` with counting versions, so while it is off the hot paths run
+    the original methods and cost nothing extra.
+    """
+
+    def __init__(self):
+        self.sinks = []
+        self.counters = dict((name, 0) for name in COUNTERS)
+        self.counting = False
+        self.profiles = None
+        self._originals = []
+        # Only one profile can run at once, so a stage within another
+        # pauses the outer stage's profile
+        self._running_profiles = []
+
+    def emit(self, event, **fields):
+        """Send the event `event` with `fields` to every sink."""
+        if not self.sinks:
+            return
+        fields['event'] = event
+        fields['time'] = time.time()
+        for sink in self.sinks:
+            sink(fields)
+
+    def stage(self, name, **fields):
+        """Return a context manager timing (and maybe profiling) the stage `name`."""
+        return _Stage(self, name, fields)
+
+    # Counters
+
+    def reset_counters(self):
+        for name in COUNTERS:
+            self.counters[name] = 0
+
+    def enable_counting(self):
+        """Start counting calls on the hot paths (see `COUNTERS`)."""
+        if self.counting:
+            return
+        self.counting = True
+        counters = self.counters
+
+        # `find`, `any`, `all` and `count` all try predicates through these
+        find = TileMap._find
+        def counting_find(tile_map, predicate):
+            return find(tile_map, _counting_predicate(predicate, counters))
+        self._patch(TileMap, '_find', counting_find)
+
+        find_where = TileMap._find_where
+        def counting_find_where(tile_map, predicate, where):
+            return find_where(tile_map, _counting_predicate(predicate, counters), where)
+        self._patch(TileMap, '_find_where', counting_find_where)
+
+        cast_until = TileMap.cast_until
+        def counting_cast_until(tile_map, start, increment, predicate):
+            counters['cast_until_calls'] += 1
+            coord = None
+            try:
+                coord = cast_until(tile_map, start, increment, predicate)
+                return coord
+            finally:
+                if coord is not None:
+                    counters['cast_until_steps'] += max(
+                        abs(coord[0] - start[0]), abs(coord[1] - start[1]))
+                else:
+                    # Ran off the view without a match
+                    counters['cast_until_steps'] += _steps_to_edge(tile_map, start, increment)
+        self._patch(TileMap, 'cast_until', counting_cast_until)
+
+        set_tile = TileMap.__setitem__
+        def counting_set_tile(tile_map, subscript, value):
+            # The single tile fast path writes to the storage's tiles
+            # directly, without going through any counted method.
+            if (subscript.__class__ in tilemap._tuple_types
+                    and not tile_map.storage.watchers
+                    and subscript[0].__class__ is int and subscript[1].__class__ is int
+                    and not isinstance(value, TileMap)):
+                counters['tiles_written'] += 1
+            set_tile(tile_map, subscript, value)
+        self._patch(TileMap, '__setitem__', counting_set_tile)
+
+        set_storage_tile = TileMapStorage.__setitem__
+        def counting_set_storage_tile(storage, subscript, value):
+            counters['tiles_written'] += 1
+            set_storage_tile(storage, subscript, value)
+        self._patch(TileMapStorage, '__setitem__', counting_set_storage_tile)
+
+        fill_rect = TileMapStorage.fill_rect
+        def counting_fill_rect(storage, x0, y0, x1, y1, value):
+            counters['tiles_written'] += (x1 - x0) * (y1 - y0)
+            fill_rect(storage, x0, y0, x1, y1, value)
+        self._patch(TileMapStorage, 'fill_rect', counting_fill_rect)
+
+        blit = TileMapStorage.blit
+        def counting_blit(storage, x0, y0, x1, y1, source, sx, sy):
+            counters['tiles_written'] += (x1 - x0) * (y1 - y0)
+            blit(storage, x0, y0, x1, y1, source, sx, sy)
+        self._patch(TileMapStorage, 'blit', counting_blit)
+
+        new_coord = Coord.__new__
+        def counting_new_coord(cls, *args, **kwargs):
+            counters['coords_created'] += 1
+            return new_coord(cls, *args, **kwargs)
+        self._patch(Coord, '__new__', staticmethod(counting_new_coord))
+
+    def disable_counting(self):
+        """Stop counting, putting back the original methods."""
+        while self._originals:
+            cls, name, original = self._originals.pop()
+            if original is _MISSING:
+                delattr(cls, name)
+            else:
+                setattr(cls, name, original)
+        self.counting = False
+
+    def _patch(self, cls, name, replacement):
+        self._originals.append((cls, name, cls.__dict__.get(name, _MISSING)))
+        setattr(cls, name, replacement)
+
+    # Profiles
+
+    def enable_profiling(self):
+        """Start profiling each stage, into a `cProfile.Profile` per stage
+        name in `profiles` (added to by each stage of that name). Time in
+        a stage within another is only in the inner stage's profile."""
+        if self.profiles is None:
+            self.profiles = {}
+
+    def disable_profiling(self):
+        self.profiles = None
+
+    def dump_profiles(self, directory):
+        """Write each stage's profile to `<directory>/<stage>.prof`, for `pstats`."""
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for name, profile in (self.profiles or {}).items():
+            profile.dump_stats(os.path.join(directory, '%s.prof' % name))
+
+
+class _Stage(object):
+    def __init__(self, instrumentation, name, fields):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.fields = fields
+
+    def __enter__(self):
+        instrumentation = self.instrumentation
+        instrumentation.emit('stage_start', stage=self.name, **self.fields)
+        if instrumentation.counting:
+            self.counters = dict(instrumentation.counters)
+        self.profile = None
+        if instrumentation.profiles is not None:
+            self.profile = instrumentation.profiles.get(self.name)
+            if self.profile is None:
+                self.profile = instrumentation.profiles[self.name] = cProfile.Profile()
+            running = instrumentation._running_profiles
+            if running:
+                running[-1].disable()
+            running.append(self.profile)
+            self.profile.enable()
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.time() - self.start
+        instrumentation = self.instrumentation
+        if self.profile is not None:
+            self.profile.disable()
+            running = instrumentation._running_profiles
+            running.pop()
+            if running:
+                running[-1].enable()
+        fields = dict(self.fields, stage=self.name, duration=duration)
+        if instrumentation.counting and hasattr(self, 'counters'):
+            fields['counters'] = dict((name, instrumentation.counters[name] - self.counters[name])
+                for name in COUNTERS)
+        if exc_type is not None:
+            fields['error'] = exc_type.__name__
+        instrumentation.emit('stage_end', **fields)
+        return False
+
+
+def _counting_predicate(predicate, counters):
+    def counting_predicate(tile_map, coord):
+        counters['find_predicate_calls'] += 1
+        return predicate(tile_map, coord)
+    return counting_predicate
+
+
+def _steps_to_edge(tile_map, start, increment):
+    """Return the number of steps of `increment` from `start` to leave `tile_map`."""
+    steps = []
+    for value, step, size in ((start[0], increment[0], tile_map.width),
+            (start[1], increment[1], tile_map.height)):
+        if step > 0:
+            steps.append(max(0, (size - value + step - 1) // step))
+        elif step < 0:
+            steps.append(max(0, value // -step + 1))
+    return min(steps) if steps else 0
+
+
+class JsonLinesSink(object):
+    """Sink writing each event as a line of JSON to the file `f`."""
+
+    def __init__(self, f):
+        self.f = f
+
+    def __call__(self, event):
+        self.f.write(json.dumps(event, sort_keys=True))
+        self.f.write('\n')
+
+
+# The instrumentation used by `gen_tilemap`
+instrumentation = Instrumentation()
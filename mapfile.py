@@ -0,0 +1,378 @@
+__all__ = ('MapFile', 'MappedTiles', 'create', 'encode', 'write', 'load', 'RAW', 'RLE')
+
+import io, mmap, re, struct, sys
+from array import array
+from tilemap import TileMap, TileMapStorage
+from walkgraph import WalkGraph
+
+# File layout (all integers little-endian):
+#
+#   header          _HEADER
+#   tile table      tile_count * (value, name length, name)
+#   section table   section_count * _SECTION (tag, offset, length)
+#   tile payload    at payload_offset, aligned to _ALIGNMENT
+#   sections        at their offsets, in any order
+#
+# A raw payload is the `width * height` tile bytes in row-major order, so
+# it can be mapped straight into a `TileMapStorage`. An RLE payload is
+# (run length, value) byte pairs, with runs of at most 255 tiles.
+
+MAGIC = b'TMAP'
+VERSION = 1
+
+# Payload encodings
+RAW = 0
+RLE = 1
+
+_HEADER = struct.Struct('<4sHHIIqQHHQQ')
+_TILE_NAME = struct.Struct('<BB')
+_SECTION = struct.Struct('<4sQQ')
+_COUNT = struct.Struct('<I')
+_NODE = struct.Struct('<i')
+_ALIGNMENT = 16
+
+ROOMS_SECTION = b'ROOM'
+WALK_GRAPH_SECTION = b'WALK'
+
+_ROOM_FIELDS = 8
+_RUN = re.compile(b'(.)\\1{0,254}', re.DOTALL)
+
+
+def _align(offset, alignment=_ALIGNMENT):
+    return (offset + alignment - 1) // alignment * alignment
+
+def _array_bytes(values):
+    """Return the bytes of `values` (an `array`) in little-endian order."""
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    if hasattr(values, 'tobytes'):
+        return values.tobytes()
+    return values.tostring()
+
+def _bytes_array(typecode, data):
+    """Return the little-endian `data` as an `array` of `typecode`."""
+    values = array(typecode)
+    if hasattr(values, 'frombytes'):
+        values.frombytes(data)
+    else:
+        values.fromstring(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def _encode_tile_names(tile_names):
+    tile_table = bytearray()
+    for value, name in sorted((tile_names or {}).items()):
+        name = name.encode('ascii')
+        tile_table += _TILE_NAME.pack(value, len(name)) + name
+    return tile_table
+
+def _encode_rle(tiles):
+    runs = bytearray()
+    for match in _RUN.finditer(bytes(tiles)):
+        runs.append(match.end() - match.start())
+        runs.extend(match.group(1))
+    return runs
+
+def _decode_rle(runs, size):
+    tiles = bytearray()
+    for i in range(0, len(runs), 2):
+        tiles.extend(runs[i + 1:i + 2] * runs[i])
+    if len(tiles) != size:
+        raise ValueError('RLE payload has %d tiles, expected %d' % (len(tiles), size))
+    return tiles
+
+def _encode_rooms(rooms):
+    fields = array('i')
+    for room in rooms:
+        fields.extend([room.tl.x, room.tl.y, room.br.x, room.br.y,
+            room.floor_height, room.ceiling_height,
+            room.left_wall_width, room.right_wall_width])
+    return _COUNT.pack(len(rooms)) + _array_bytes(fields)
+
+def _decode_rooms(data, storage, room_class):
+    count, = _COUNT.unpack_from(data)
+    fields = _bytes_array('i', data[_COUNT.size:_COUNT.size + 4 * _ROOM_FIELDS * count])
+    rooms = []
+    for i in range(0, len(fields), _ROOM_FIELDS):
+        x0, y0, x1, y1, floor, ceiling, left, right = fields[i:i + _ROOM_FIELDS]
+        room = room_class(tl=(x0, y0), br=(x1, y1), storage=storage)
+        room.floor_height = floor
+        room.ceiling_height = ceiling
+        room.left_wall_width = left
+        room.right_wall_width = right
+        rooms.append(room)
+    return rooms
+
+def _encode_walk_graph(walk_graph):
+    return b''.join([
+        _COUNT.pack(walk_graph.edge_count),
+        _NODE.pack(-1 if walk_graph.start is None else walk_graph.start),
+        bytes(walk_graph.nodes),
+        _array_bytes(walk_graph.offsets),
+        _array_bytes(walk_graph.targets),
+        bytes(walk_graph.kinds),
+        ])
+
+def _decode_walk_graph(data, width, height):
+    size = width * height
+    edge_count, = _COUNT.unpack_from(data)
+    start_node, = _NODE.unpack_from(data, _COUNT.size)
+    start = _COUNT.size + _NODE.size
+    nodes = bytearray(data[start:start + size])
+    start += size
+    offsets = _bytes_array('i', data[start:start + 4 * (size + 1)])
+    start += 4 * (size + 1)
+    targets = _bytes_array('i', data[start:start + 4 * edge_count])
+    start += 4 * edge_count
+    kinds = bytearray(data[start:start + edge_count])
+    return WalkGraph(width, height, nodes, offsets, targets, kinds,
+        None if start_node == -1 else start_node)
+
+
+def write(f, tile_map, seed=0, params_hash=0, tile_names=None,
+        rooms=None, walk_graph=None, encoding=RAW):
+    """
+    Write `tile_map` to the binary file `f`, with optional `rooms` and
+    `walk_graph` sections.
+
+    `params_hash` identifies the generation parameters the map was made
+    with, and `tile_names` is a dict of tile value to name.
+    """
+    width, height = tile_map.width, tile_map.height
+    tiles = bytearray().join(tile_map.rows())
+    if encoding == RLE:
+        payload = _encode_rle(tiles)
+    elif encoding == RAW:
+        payload = tiles
+    else:
+        raise ValueError('unknown encoding %r' % (encoding,))
+
+    tile_table = _encode_tile_names(tile_names)
+
+    sections = []
+    if rooms is not None:
+        sections.append((ROOMS_SECTION, _encode_rooms(rooms)))
+    if walk_graph is not None:
+        sections.append((WALK_GRAPH_SECTION, _encode_walk_graph(walk_graph)))
+
+    payload_offset = _align(_HEADER.size + len(tile_table) + _SECTION.size * len(sections))
+    chunks = [(payload_offset, payload)]
+    offset = _align(payload_offset + len(payload))
+    section_table = bytearray()
+    for tag, data in sections:
+        section_table += _SECTION.pack(tag, offset, len(data))
+        chunks.append((offset, data))
+        offset = _align(offset + len(data))
+
+    header = _HEADER.pack(MAGIC, VERSION, encoding, width, height, seed or 0,
+        params_hash, len(tile_names or ()), len(sections), payload_offset, len(payload))
+    chunks.insert(0, (0, header + tile_table + section_table))
+    position = 0
+    for start, data in chunks:
+        f.write(b'\0' * (start - position))
+        f.write(bytes(data))
+        position = start + len(data)
+
+def encode(tile_map, **kwargs):
+    """Return the bytes `write()` would write for `tile_map`."""
+    f = io.BytesIO()
+    write(f, tile_map, **kwargs)
+    return f.getvalue()
+
+
+class MappedTiles(object):
+    """
+    Mutable buffer of `length` tiles starting at byte `offset` of the
+    memory map `map`, usable as the `tiles` of a `TileMapStorage`.
+
+    Indexing gives ints and slicing gives `bytearray` copies, as for a
+    `bytearray`, but nothing is read into memory until it is used.
+    """
+
+    def __init__(self, map, offset, length):
+        assert offset + length <= len(map)
+        self.map = map
+        self.offset = offset
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def _position(self, index):
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        return self.offset + index
+
+    def _range(self, index):
+        start, stop, step = index.indices(self.length)
+        return self.offset + start, self.offset + max(start, stop), step
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = self._range(index)
+            if step == 1:
+                return bytearray(self.map[start:stop])
+            return bytearray(self.map[start:stop:step])
+        position = self._position(index)
+        return ord(self.map[position:position + 1])
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            start, stop, step = self._range(index)
+            if step != 1 or stop - start != len(value):
+                raise ValueError('MappedTiles can only replace a slice of the same length')
+            self.map[start:stop] = bytes(value)
+        else:
+            position = self._position(index)
+            self.map[position:position + 1] = bytes(bytearray([value]))
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def count(self, value):
+        return self[:].count(value)
+
+    def flush(self):
+        self.map.flush()
+
+
+class MapFile(object):
+    """
+    A map loaded by `load()`.
+
+    `tile_map` is a view of the whole map, and `rooms` and `walk_graph`
+    are None if the file has no such sections. Raw maps keep the file
+    mapped until `close()`.
+    """
+
+    def __init__(self, width, height, seed, params_hash, tile_names, encoding,
+            tile_map, rooms=None, walk_graph=None, map=None, file=None):
+        self.width = width
+        self.height = height
+        self.seed = seed
+        self.params_hash = params_hash
+        self.tile_names = tile_names
+        self.encoding = encoding
+        self.tile_map = tile_map
+        self.rooms = rooms
+        self.walk_graph = walk_graph
+        self._map = map
+        self._file = file
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def create(path, width, height, seed=0, params_hash=0, tile_names=None):
+    """
+    Create a map file at `path` of `width` by `height` empty tiles, and
+    return it loaded writable (see `load()`).
+
+    The payload is made by extending the file, so on file systems with
+    sparse files no disk is used until tiles are written, and the map
+    can be far bigger than memory.
+    """
+    tile_table = _encode_tile_names(tile_names)
+    payload_offset = _align(_HEADER.size + len(tile_table))
+    header = _HEADER.pack(MAGIC, VERSION, RAW, width, height, seed or 0,
+        params_hash, len(tile_names or ()), 0, payload_offset, width * height)
+    with open(path, 'wb') as f:
+        f.write(header + tile_table)
+        f.truncate(payload_offset + width * height)
+    return load(path, writable=True)
+
+def load(path, writable=False, room_class=TileMap):
+    """
+    Load the map at `path`, returning a `MapFile`.
+
+    Only a RAW tile payload is memory-mapped without copying, so loading
+    costs the same however big the map is and the pages are shared
+    between processes loading the same file. An RLE payload is decoded
+    into memory. If `writable`, writes to the map go back to the file,
+    which must have a RAW payload (ValueError otherwise). Rooms are
+    loaded as `room_class` views.
+    """
+    f = open(path, 'r+b' if writable else 'rb')
+    try:
+        map = mmap.mmap(f.fileno(), 0,
+            access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+    except Exception:
+        f.close()
+        raise
+    try:
+        return _load(map, f, room_class, writable)
+    except Exception:
+        map.close()
+        f.close()
+        raise
+
+def _load(map, f, room_class, writable=False):
+    if len(map) < _HEADER.size:
+        raise ValueError('not a map file')
+    (magic, version, encoding, width, height, seed, params_hash,
+        tile_count, section_count, payload_offset, payload_length) = \
+        _HEADER.unpack(map[:_HEADER.size])
+    if magic != MAGIC:
+        raise ValueError('not a map file')
+    if version != VERSION:
+        raise ValueError('unsupported map file version %d' % version)
+
+    if writable and encoding != RAW:
+        raise ValueError('only maps with a raw payload can be loaded writable')
+
+    offset = _HEADER.size
+    tile_names = {}
+    for i in range(tile_count):
+        value, name_length = _TILE_NAME.unpack(map[offset:offset + _TILE_NAME.size])
+        offset += _TILE_NAME.size
+        tile_names[value] = map[offset:offset + name_length].decode('ascii')
+        offset += name_length
+    sections = {}
+    for i in range(section_count):
+        tag, start, length = _SECTION.unpack(map[offset:offset + _SECTION.size])
+        sections[tag] = (start, length)
+        offset += _SECTION.size
+
+    if encoding == RAW:
+        if payload_length != width * height:
+            raise ValueError('raw payload has %d tiles, expected %d'
+                % (payload_length, width * height))
+        tiles = MappedTiles(map, payload_offset, payload_length)
+    elif encoding == RLE:
+        tiles = _decode_rle(bytearray(map[payload_offset:payload_offset + payload_length]),
+            width * height)
+    else:
+        raise ValueError('unknown encoding %d' % encoding)
+    storage = TileMapStorage(width, height, tiles=tiles)
+    tile_map = TileMap(width=width, height=height, storage=storage)
+
+    rooms = walk_graph = None
+    if ROOMS_SECTION in sections:
+        start, length = sections[ROOMS_SECTION]
+        rooms = _decode_rooms(map[start:start + length], storage, room_class)
+    if WALK_GRAPH_SECTION in sections:
+        start, length = sections[WALK_GRAPH_SECTION]
+        walk_graph = _decode_walk_graph(map[start:start + length], width, height)
+
+    if encoding != RAW:
+        map.close()
+        f.close()
+        map = f = None
+    return MapFile(width, height, seed, params_hash, tile_names, encoding,
+        tile_map, rooms, walk_graph, map, f)
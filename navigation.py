@@ -0,0 +1,240 @@
+__all__ = ('Navigator',)
+
+import heapq
+from array import array
+from connectivity import Connectivity
+from walkgraph import DROP
+
+# Sources (or targets) with at least this many queries in a batch share a
+# distance field, rather than each query running its own A* search
+BATCH_FIELD_MINIMUM = 4
+
+
+class Navigator(object):
+    """
+    Shortest path queries on a `WalkGraph`, counting each edge (a step,
+    a stair, a ladder rung or a whole drop) as one move.
+
+    Which components of the graph can reach which is worked out once,
+    from its `Connectivity` (built if not given), so a query between
+    tiles that can't reach each other is answered without any search.
+    """
+
+    def __init__(self, graph, connectivity=None):
+        self.graph = graph
+        if connectivity is None:
+            connectivity = Connectivity(graph)
+        self.components = connectivity.components
+
+        # A bit set of the components each component can reach. Every edge
+        # goes to a lower component id, so going up from 0 the successors
+        # of each component are already done.
+        successors = [set() for component in range(connectivity.component_count)]
+        for node, target, kind in connectivity.one_way_edges:
+            successors[self.components[node]].add(self.components[target])
+        self._reachable = []
+        for component in range(connectivity.component_count):
+            reachable = 1 << component
+            for other in successors[component]:
+                reachable |= self._reachable[other]
+            self._reachable.append(reachable)
+
+        # The longest drop, as the most rows one move can go down
+        width = graph.width
+        offsets, targets, kinds = graph.offsets, graph.targets, graph.kinds
+        self.drop_height = 1
+        node = graph.nodes.find(b'\x01')
+        while node != -1:
+            for i in range(offsets[node], offsets[node + 1]):
+                if kinds[i] == DROP:
+                    self.drop_height = max(self.drop_height, targets[i] // width - node // width)
+            node = graph.nodes.find(b'\x01', node + 1)
+
+    def _node(self, coord):
+        node = self.graph._node(coord)
+        if node is None:
+            raise KeyError(coord)
+        return node
+
+    def _can_reach(self, source, target):
+        return bool(self._reachable[self.components[source]] >> self.components[target] & 1)
+
+    def can_reach(self, source, target):
+        """Return True if the coord `target` can be reached from the coord `source`."""
+        return self._can_reach(self._node(source), self._node(target))
+
+    def estimate(self, node, target):
+        """
+        Return a lower bound on the moves from node id `node` to node id
+        `target`. Every move goes at most one column across and one row
+        up, and at most one row down except a drop, which goes at most
+        `drop_height` rows down, so the bound never overestimates.
+        """
+        y, x = divmod(node, self.graph.width)
+        target_y, target_x = divmod(target, self.graph.width)
+        if target_y < y:
+            rows = y - target_y
+        else:
+            rows = -(-(target_y - y) // self.drop_height)
+        return max(abs(target_x - x), rows)
+
+    # Single queries
+
+    def _search(self, source, target):
+        """Return the node ids of a shortest path from node `source` to
+        node `target` by A*, or None if there is none."""
+        if not self._can_reach(source, target):
+            return None
+        graph = self.graph
+        offsets, targets = graph.offsets, graph.targets
+        width = graph.width
+        drop_height = self.drop_height
+        target_y, target_x = divmod(target, width)
+        moves = array('i', [-1]) * (width * graph.height)
+        came_from = array('i', [-1]) * (width * graph.height)
+        moves[source] = 0
+        # (estimated total moves, moves so far negated, node): among equal
+        # estimates, expand the furthest along first
+        open_nodes = [(self.estimate(source, target), 0, source)]
+        while open_nodes:
+            estimate, negative_moves, node = heapq.heappop(open_nodes)
+            if node == target:
+                break
+            if -negative_moves > moves[node]:
+                # Already expanded by a shorter route
+                continue
+            next_moves = moves[node] + 1
+            for i in range(offsets[node], offsets[node + 1]):
+                other = targets[i]
+                if moves[other] != -1 and moves[other] <= next_moves:
+                    continue
+                moves[other] = next_moves
+                came_from[other] = node
+                y, x = divmod(other, width)
+                if target_y < y:
+                    rows = y - target_y
+                else:
+                    rows = -(-(target_y - y) // drop_height)
+                heapq.heappush(open_nodes,
+                    (next_moves + max(abs(target_x - x), rows), -next_moves, other))
+        else:
+            return None
+        path = [target]
+        while path[-1] != source:
+            path.append(came_from[path[-1]])
+        path.reverse()
+        return path
+
+    def path(self, source, target):
+        """Return a list of the coords of a shortest path from the coord
+        `source` to the coord `target` (including both), or None if there
+        is none."""
+        path = self._search(self._node(source), self._node(target))
+        if path is None:
+            return None
+        return [self.graph.coord(node) for node in path]
+
+    def distance(self, source, target):
+        """Return the fewest moves from the coord `source` to the coord
+        `target`, or None if it can't be reached."""
+        path = self._search(self._node(source), self._node(target))
+        if path is None:
+            return None
+        return len(path) - 1
+
+    def distance_field(self, coord, reverse=False):
+        """
+        Return an `array('i')` of the fewest moves from `coord` to each
+        tile, indexed by node id (`y * width + x`), with -1 for tiles that
+        can't be reached. If `reverse`, the moves are instead from each
+        tile to `coord`.
+        """
+        return self._distance_field(self._node(coord), reverse)
+
+    def _distance_field(self, source, reverse=False):
+        graph = (self.graph.reverse() if reverse else self.graph)
+        offsets, targets = graph.offsets, graph.targets
+        field = array('i', [-1]) * (graph.width * graph.height)
+        field[source] = 0
+        frontier = [source]
+        moves = 0
+        while frontier:
+            moves += 1
+            next_frontier = []
+            for node in frontier:
+                for i in range(offsets[node], offsets[node + 1]):
+                    other = targets[i]
+                    if field[other] == -1:
+                        field[other] = moves
+                        next_frontier.append(other)
+            frontier = next_frontier
+        return field
+
+    def _field_path(self, field, start, reverse):
+        """Return the node ids of a shortest path from `start` down the
+        distance `field` to its source. A forward field (from its source)
+        is walked back along the reversed graph, and the path reversed."""
+        graph = (self.graph if reverse else self.graph.reverse())
+        offsets, targets = graph.offsets, graph.targets
+        path = [start]
+        node = start
+        while field[node]:
+            for i in range(offsets[node], offsets[node + 1]):
+                if field[targets[i]] == field[node] - 1:
+                    node = targets[i]
+                    break
+            path.append(node)
+        if not reverse:
+            path.reverse()
+        return path
+
+    # Batches
+
+    def paths(self, pairs):
+        """Return a list of `path(source, target)` for each `(source,
+        target)` pair of coords in `pairs`."""
+        coord = self.graph.coord
+        return [None if path is None else [coord(node) for node in path]
+            for path in self._batch(pairs, want_paths=True)]
+
+    def distances(self, pairs):
+        """Return a list of `distance(source, target)` for each `(source,
+        target)` pair of coords in `pairs`."""
+        return self._batch(pairs, want_paths=False)
+
+    def _batch(self, pairs, want_paths):
+        """
+        Answer each `(source, target)` query in `pairs`, as a list of node
+        ids if `want_paths`, else a number of moves.
+
+        Pairs that can't reach each other are answered from the component
+        reachability. Sources with many queries get one distance field for
+        all of them, then targets with many of the remaining queries get
+        one reversed distance field. The rest are searched one by one.
+        """
+        queries = [(self._node(source), self._node(target)) for source, target in pairs]
+        results = [None] * len(queries)
+        pending = {}
+        for i, (source, target) in enumerate(queries):
+            if self._can_reach(source, target):
+                pending[i] = (source, target)
+
+        for reverse in (False, True):
+            groups = {}
+            for i, query in pending.items():
+                groups.setdefault(query[reverse], []).append(i)
+            for node, indices in groups.items():
+                if len(indices) < BATCH_FIELD_MINIMUM:
+                    continue
+                field = self._distance_field(node, reverse)
+                for i in indices:
+                    other = pending.pop(i)[not reverse]
+                    if want_paths:
+                        results[i] = self._field_path(field, other, reverse)
+                    else:
+                        results[i] = field[other]
+
+        for i, (source, target) in pending.items():
+            path = self._search(source, target)
+            results[i] = (path if want_paths else len(path) - 1)
+        return results
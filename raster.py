@@ -0,0 +1,34 @@
+__all__ = ('pack', 'unpack', 'neighbour')
+
+import binascii
+
+# Rasters are row-major `bytearray`s with one 0 or 1 byte per tile, as
+# returned by `TileMap.mask()`. Packed into a Python integer (first tile
+# most significant, one byte per tile) they can be combined a whole map
+# at a time with `&`, `|` and shifts.
+
+def pack(raster):
+    """Return `raster` packed into an integer."""
+    if not raster:
+        return 0
+    return int(binascii.hexlify(raster), 16)
+
+def unpack(value, size):
+    """Return the packed integer `value` as a raster of `size` tiles."""
+    if not size:
+        return bytearray()
+    return bytearray(binascii.unhexlify('%0*x' % (2 * size, value)))
+
+def neighbour(value, offset, size):
+    """
+    Return the packed raster whose tile `i` is tile `i + offset` of the
+    packed raster `value`, or 0 where that is outside the raster.
+
+    With an offset of `width` (or `-width`) this is the raster of the
+    tiles below (or above) each tile. Horizontal offsets wrap between
+    rows.
+    """
+    if offset >= 0:
+        return (value << (8 * offset)) & ((1 << (8 * size)) - 1)
+    else:
+        return value >> (8 * -offset)
@@ -0,0 +1,180 @@
+#!/usr/local/bin/python
+__all__ = ('render', 'encode_png', 'encode_ppm', 'write_image', 'IMAGE_FORMATS')
+
+import optparse, struct, zlib
+
+ROOM_COLOR = '#888888'
+TWO_WAY_COLOR = '#00ff00'
+ONE_WAY_COLOR = '#ff0000'
+BACKGROUND_COLOR = '#ffffff'
+
+
+def _parse_color(color):
+    """Return the `(r, g, b)` of a `#rrggbb` color."""
+    return tuple(int(color[i:i + 2], 16) for i in (1, 3, 5))
+
+def _channel_tables(tile_colors):
+    """Return a translation table per channel, mapping tile values to that
+    channel of their color in `tile_colors` (unknown values get the color
+    for None, and no color the background)."""
+    default = tile_colors.get(None) or BACKGROUND_COLOR
+    tables = (bytearray(256), bytearray(256), bytearray(256))
+    for value in range(256):
+        color = _parse_color(tile_colors.get(value, default) or BACKGROUND_COLOR)
+        for channel in range(3):
+            tables[channel][value] = color[channel]
+    return tables
+
+
+class _Image(object):
+    """RGB pixels, as one row-major `bytearray` of 3 bytes per pixel."""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.stride = 3 * width
+        self.pixels = bytearray(self.stride * height)
+
+    def fill_rect(self, x0, y0, x1, y1, color):
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, self.width), min(y1, self.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        row = bytearray(color) * (x1 - x0)
+        for start in range(y0 * self.stride + 3 * x0, y1 * self.stride, self.stride):
+            self.pixels[start:start + len(row)] = row
+
+    def line(self, x0, y0, x1, y1, color, thickness=1):
+        """Draw a line from pixel (x0, y0) to (x1, y1)."""
+        half = thickness // 2
+        if y0 == y1:
+            self.fill_rect(min(x0, x1), y0 - half, max(x0, x1) + 1, y0 - half + thickness, color)
+        elif x0 == x1:
+            self.fill_rect(x0 - half, min(y0, y1), x0 - half + thickness, max(y0, y1) + 1, color)
+        else:
+            steps = max(abs(x1 - x0), abs(y1 - y0))
+            for step in range(steps + 1):
+                x = x0 + (x1 - x0) * step // steps
+                y = y0 + (y1 - y0) * step // steps
+                self.fill_rect(x - half, y - half, x - half + thickness, y - half + thickness, color)
+
+
+def render(tile_map, tile_colors, scale=1, rooms=None, walk_graph=None):
+    """
+    Return `(width, height, pixels)` of an image of `tile_map`, with
+    `scale` by `scale` pixels per tile colored from `tile_colors` (a dict
+    of tile value to `#rrggbb`, as for `TileMapGUI`), and optionally
+    outlines of `rooms` and the edges of `walk_graph` over the top.
+
+    `pixels` is a `bytearray` of 3 bytes (red, green, blue) per pixel.
+    Each row of tiles becomes a scanline by translating the tile values
+    through a table per channel, and spreading the channels out with
+    strided slice assignments.
+    """
+    tables = _channel_tables(tile_colors)
+    image = _Image(tile_map.width * scale, tile_map.height * scale)
+    pixels = image.pixels
+    stride = image.stride
+    scanline = bytearray(stride)
+    for y, row in enumerate(tile_map.rows()):
+        for channel in range(3):
+            values = row.translate(tables[channel])
+            for offset in range(channel, 3 * scale, 3):
+                scanline[offset::3 * scale] = values
+        for line in range(y * scale, (y + 1) * scale):
+            pixels[line * stride:(line + 1) * stride] = scanline
+
+    if rooms:
+        color = _parse_color(ROOM_COLOR)
+        for room in rooms:
+            x0, y0 = (room.tl.x - tile_map.tl.x) * scale, (room.tl.y - tile_map.tl.y) * scale
+            x1, y1 = (room.br.x - tile_map.tl.x) * scale - 1, (room.br.y - tile_map.tl.y) * scale - 1
+            image.line(x0, y0, x1, y0, color)
+            image.line(x0, y1, x1, y1, color)
+            image.line(x0, y0, x0, y1, color)
+            image.line(x1, y0, x1, y1, color)
+
+    if walk_graph is not None:
+        two_way_color = _parse_color(TWO_WAY_COLOR)
+        one_way_color = _parse_color(ONE_WAY_COLOR)
+        thickness = max(1, scale // 4)
+        width = walk_graph.width
+        centre = scale // 2
+        nodes = walk_graph.nodes
+        node = nodes.find(b'\x01')
+        while node != -1:
+            y, x = divmod(node, width)
+            for target in walk_graph.neighbor_ids(node):
+                two_way = node in walk_graph.neighbor_ids(target)
+                if two_way and target < node:
+                    # Drawn from the other end
+                    continue
+                target_y, target_x = divmod(target, width)
+                image.line(x * scale + centre, y * scale + centre,
+                    target_x * scale + centre, target_y * scale + centre,
+                    two_way_color if two_way else one_way_color, thickness)
+            node = nodes.find(b'\x01', node + 1)
+
+    return image.width, image.height, pixels
+
+
+def _png_chunk(kind, data):
+    chunk = kind + data
+    return struct.pack('>I', len(data)) + chunk + struct.pack('>I', zlib.crc32(chunk) & 0xffffffff)
+
+def encode_png(width, height, pixels, level=6):
+    """Return the RGB `pixels` (as returned by `render`) as a PNG."""
+    stride = 3 * width
+    # Each scanline starts with its filter type, 0 (none)
+    raw = bytearray((stride + 1) * height)
+    for y in range(height):
+        raw[y * (stride + 1) + 1:(y + 1) * (stride + 1)] = pixels[y * stride:(y + 1) * stride]
+    return b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)),
+        _png_chunk(b'IDAT', zlib.compress(bytes(raw), level)),
+        _png_chunk(b'IEND', b''),
+        ])
+
+def encode_ppm(width, height, pixels):
+    """Return the RGB `pixels` (as returned by `render`) as a binary PPM."""
+    return ('P6\n%d %d\n255\n' % (width, height)).encode('ascii') + bytes(pixels)
+
+IMAGE_FORMATS = {
+    'png': encode_png,
+    'ppm': encode_ppm,
+    }
+
+def write_image(path, tile_map, tile_colors, scale=1, rooms=None, walk_graph=None, format=None):
+    """Render `tile_map` (see `render`) to `path`, as PNG or PPM by its extension."""
+    if format is None:
+        format = path.rsplit('.', 1)[-1].lower()
+    data = IMAGE_FORMATS[format](*render(tile_map, tile_colors, scale, rooms, walk_graph))
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def main(argv=None):
+    import gen_tilemap
+    parser = optparse.OptionParser(
+        usage="%prog [options] OUTPUT.png|OUTPUT.ppm",
+        description="Generate a map and render it to an image, without a display.")
+    parser.add_option('-s', '--seed', type='int', default=gen_tilemap.DEFAULT_SEED,
+        help="random seed (default %default)")
+    parser.add_option('--scale', type='int', default=8,
+        help="pixels per tile (default %default)")
+    parser.add_option('--rooms', action='store_true', default=False,
+        help="outline the rooms")
+    parser.add_option('--walk-graph', action='store_true', default=False,
+        help="draw the walk graph")
+    options, args = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error("expected one output path")
+    gen_tilemap.VERBOSE = False
+    tile_map, rooms, walk_graph = gen_tilemap.generate(options.seed)
+    write_image(args[0], tile_map, gen_tilemap.TILE_COLORS, options.scale,
+        rooms=(rooms if options.rooms else None),
+        walk_graph=(walk_graph if options.walk_graph else None))
+
+if __name__ == '__main__':
+    main()
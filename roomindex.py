@@ -0,0 +1,93 @@
+__all__ = ('RoomIndex', 'NO_ROOM')
+
+from array import array
+
+NO_ROOM = -1
+
+
+class RoomIndex(object):
+    """
+    Raster of room ids over a partition of a tile map into rooms, and
+    the graph of which rooms are next to each other.
+
+    `ids` is a flat `array('h')` of `width * height` entries holding the
+    index into `rooms` of the room covering each tile (or `NO_ROOM`).
+    `adjacency[i]` is a dict of the id of each room next to room `i` to
+    the length of the edge they share, in tiles.
+    """
+
+    def __init__(self, rooms, width, height):
+        self.rooms = list(rooms)
+        self.width = width
+        self.height = height
+        assert len(self.rooms) < 2 ** 15
+        self._room_ids = dict((room, room_id) for (room_id, room) in enumerate(self.rooms))
+
+        ids = array('h', [NO_ROOM]) * (width * height)
+        for room_id, room in enumerate(self.rooms):
+            row = array('h', [room_id]) * room.width
+            for start in range(room.tl.y * width + room.tl.x, room.br.y * width, width):
+                ids[start:start + room.width] = row
+        self.ids = ids
+        self.adjacency = self._find_adjacency()
+
+    def _find_adjacency(self):
+        adjacency = [{} for room in self.rooms]
+        width = self.width
+        for room_id, room in enumerate(self.rooms):
+            # Rooms are rectangles, so checking just outside the right and
+            # bottom edges of each finds every pair of neighbours once.
+            neighbours = array('h')
+            if room.br.x < width:
+                start = room.tl.y * width + room.br.x
+                neighbours.extend(self.ids[start:room.br.y * width:width])
+            if room.br.y < self.height:
+                start = room.br.y * width
+                neighbours.extend(self.ids[start + room.tl.x:start + room.br.x])
+            for other_id in neighbours:
+                if other_id == NO_ROOM or other_id == room_id:
+                    continue
+                adjacency[room_id][other_id] = adjacency[room_id].get(other_id, 0) + 1
+                adjacency[other_id][room_id] = adjacency[other_id].get(room_id, 0) + 1
+        return adjacency
+
+    def room_id(self, room):
+        """Return the id of `room`."""
+        return self._room_ids[room]
+
+    def room_id_at(self, coord):
+        """Return the id of the room covering `coord`, or `NO_ROOM`."""
+        x, y = coord
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self.ids[y * self.width + x]
+        return NO_ROOM
+
+    def neighbours(self, room):
+        """Return a list of `(other_room, shared_edge_length)` for the rooms next to `room`."""
+        adjacent = self.adjacency[self.room_id(room)]
+        return [(self.rooms[other_id], adjacent[other_id]) for other_id in sorted(adjacent)]
+
+    def edges(self):
+        """Return an iterable of `(room_id, other_room_id, shared_edge_length)`
+        for each pair of neighbouring rooms, with `room_id < other_room_id`."""
+        for room_id, adjacent in enumerate(self.adjacency):
+            for other_id in sorted(adjacent):
+                if room_id < other_id:
+                    yield (room_id, other_id, adjacent[other_id])
+
+    # Dict compatible view of coord to room
+
+    def __getitem__(self, coord):
+        room_id = self.room_id_at(coord)
+        if room_id == NO_ROOM:
+            raise KeyError(coord)
+        return self.rooms[room_id]
+
+    def get(self, coord, default=None):
+        room_id = self.room_id_at(coord)
+        if room_id == NO_ROOM:
+            return default
+        return self.rooms[room_id]
+
+    def __contains__(self, coord):
+        return self.room_id_at(coord) != NO_ROOM
@@ -1,30 +1,271 @@
 __all__ = ('Coord', 'TileMap')
 
+import itertools
+from array import array
 from collections import defaultdict, namedtuple
-from filters import is_tile
+from filters import is_not, is_tile, mask_table
 
 class TileMapStorage(object):
-    def __init__(self, width, height):
+    """Contiguous row-major tile buffer, one byte per tile.
+
+    `tiles` is a flat `bytearray` (or any other mutable buffer of the same
+    length) indexed by `y * width + x`. TileMap views are windows onto it.
+
+    Writes must go through the storage (not straight to `tiles`) so that
+    `watchers` are told which rectangle is about to change and then has
+    changed, by calls to their `tiles_changing(x0, y0, x1, y1)` and
+    `tiles_changed(x0, y0, x1, y1)`.
+    """
+
+    def __init__(self, width, height, tiles=None):
         self.width = width
         self.height = height
-        self.tiles = []
-        for y in range(self.height):
-            self.tiles.append([0] * self.width)
+        if tiles is None:
+            tiles = bytearray(width * height)
+        assert len(tiles) == width * height
+        self.tiles = tiles
+        self.watchers = []
+        self._column_indexes = {}
+        self._region_watchers = None
+
+    def tiles_changing(self, x0, y0, x1, y1):
+        for watcher in self.watchers:
+            watcher.tiles_changing(x0, y0, x1, y1)
+
+    def tiles_changed(self, x0, y0, x1, y1):
+        for watcher in self.watchers:
+            watcher.tiles_changed(x0, y0, x1, y1)
+
+    def watch_region(self, watcher, x0, y0, x1, y1):
+        """Add a watcher that is only told about writes that overlap the
+        rectangle from (x0, y0) to (x1, y1)."""
+        if self._region_watchers is None:
+            self._region_watchers = RegionWatchers()
+            self.watchers.append(self._region_watchers)
+        self._region_watchers.add(watcher, x0, y0, x1, y1)
+
+    def unwatch_region(self, watcher):
+        self._region_watchers.remove(watcher)
+        if not self._region_watchers.rects:
+            self.watchers.remove(self._region_watchers)
+            self._region_watchers = None
+
+    def column_index(self, tiles):
+        """Return the (shared, lazily built) `ColumnIndex` for `tiles`."""
+        tiles = frozenset(tiles)
+        index = self._column_indexes.get(tiles)
+        if index is None:
+            index = ColumnIndex(self, tiles)
+            self._column_indexes[tiles] = index
+            self.watchers.append(index)
+        return index
+
+    def index(self, x, y):
+        return y * self.width + x
 
     def __getitem__(self, subscript):
-        assert isinstance(subscript, Coord)
-        return self.tiles[subscript.y][subscript.x]
+        x, y = subscript
+        return self.tiles[y * self.width + x]
 
     def __setitem__(self, subscript, value):
-        assert isinstance(subscript, Coord)
-        self.tiles[subscript.y][subscript.x] = value
+        x, y = subscript
+        if self.watchers:
+            self.tiles_changing(x, y, x + 1, y + 1)
+        self.tiles[y * self.width + x] = value
+        if self.watchers:
+            self.tiles_changed(x, y, x + 1, y + 1)
+
+    def row(self, y, x0=0, x1=None):
+        """Return a copy of the tiles in row `y` from `x0` to `x1`."""
+        if x1 is None:
+            x1 = self.width
+        start = y * self.width
+        return self.tiles[start + x0:start + x1]
+
+    def fill_rect(self, x0, y0, x1, y1, value):
+        """Set every tile in the rectangle from (x0, y0) to (x1, y1) to `value`."""
+        if self.watchers:
+            self.tiles_changing(x0, y0, x1, y1)
+        tiles = self.tiles
+        width = self.width
+        if x0 == 0 and x1 == width:
+            tiles[y0 * width:y1 * width] = bytearray([value]) * ((y1 - y0) * width)
+        else:
+            row = bytearray([value]) * (x1 - x0)
+            for start in range(y0 * width + x0, y1 * width + x0, width):
+                tiles[start:start + x1 - x0] = row
+        if self.watchers:
+            self.tiles_changed(x0, y0, x1, y1)
+
+    def blit(self, x0, y0, x1, y1, source, sx, sy):
+        """Copy the rectangle from (x0, y0) to (x1, y1) from `source`
+        storage, whose matching rectangle starts at (sx, sy)."""
+        tiles = self.tiles
+        width = self.width
+        row_width = x1 - x0
+        rows = [source.row(sy + y, sx, sx + row_width) for y in range(y1 - y0)]
+        if self.watchers:
+            self.tiles_changing(x0, y0, x1, y1)
+        for y, row in enumerate(rows):
+            start = (y0 + y) * width + x0
+            tiles[start:start + row_width] = row
+        if self.watchers:
+            self.tiles_changed(x0, y0, x1, y1)
 
     def copy(self):
-        storage = self.__class__(width=self.width, height=self.height)
-        storage.tiles = []
-        for y in range(self.height):
-            storage.tiles.append(list(self.tiles[y]))
-        return storage
+        return self.__class__(width=self.width, height=self.height,
+            tiles=bytearray(self.tiles[:]))
+
+
+class ColumnIndex(object):
+    """
+    For each tile of a storage, the nearest tile at or below it that is
+    one of `tiles`, and the end of the run of `tiles` starting at it.
+
+    Columns are built when first queried, and dropped again when tiles
+    in them are written.
+    """
+
+    def __init__(self, storage, tiles):
+        self.storage = storage
+        self.tiles = frozenset(tiles)
+        self.table = mask_table(self.tiles)
+        self.columns = {}
+
+    def tiles_changing(self, x0, y0, x1, y1):
+        pass
+
+    def tiles_changed(self, x0, y0, x1, y1):
+        columns = self.columns
+        if x1 - x0 > len(columns):
+            for x in [x for x in columns if x0 <= x < x1]:
+                del columns[x]
+        else:
+            for x in range(x0, x1):
+                columns.pop(x, None)
+
+    def column(self, x):
+        """Return `(below, run_end)` arrays of storage rows for column `x`."""
+        column = self.columns.get(x)
+        if column is None:
+            height = self.storage.height
+            mask = self.storage.tiles[x::self.storage.width].translate(self.table)
+            below = array('i', [height]) * height
+            run_end = array('i', [height]) * height
+            next_below = height
+            next_run_end = height
+            for y in range(height - 1, -1, -1):
+                if mask[y]:
+                    next_below = y
+                else:
+                    next_run_end = y
+                below[y] = next_below
+                run_end[y] = (next_run_end if mask[y] else y)
+            column = (below, run_end)
+            self.columns[x] = column
+        return column
+
+    def below(self, x, y):
+        """Return the first row at or below (x, y) with one of `tiles`, or `height` if none."""
+        return self.column(x)[0][y]
+
+    def run_end(self, x, y):
+        """Return the first row at or below (x, y) without one of `tiles`, or `height` if none."""
+        return self.column(x)[1][y]
+
+
+class RegionWatchers(object):
+    """
+    Watcher that passes writes on to the watchers of just the rectangles
+    they overlap, found through a grid of `cell_size` buckets.
+    """
+
+    def __init__(self, cell_size=16):
+        self.cell_size = cell_size
+        self.buckets = defaultdict(list)
+        self.rects = {}
+        self._changing = (None, [])
+
+    def _cells(self, x0, y0, x1, y1):
+        size = self.cell_size
+        return [(cell_x, cell_y)
+            for cell_y in range(y0 // size, (y1 - 1) // size + 1)
+            for cell_x in range(x0 // size, (x1 - 1) // size + 1)]
+
+    def add(self, watcher, x0, y0, x1, y1):
+        self.rects[watcher] = (x0, y0, x1, y1)
+        for cell in self._cells(x0, y0, x1, y1):
+            self.buckets[cell].append(watcher)
+
+    def remove(self, watcher):
+        for cell in self._cells(*self.rects.pop(watcher)):
+            self.buckets[cell].remove(watcher)
+
+    def _overlapping(self, x0, y0, x1, y1):
+        buckets = self.buckets
+        rects = self.rects
+        overlapping = []
+        for cell in self._cells(x0, y0, x1, y1):
+            for watcher in buckets.get(cell, ()):
+                rx0, ry0, rx1, ry1 = rects[watcher]
+                if (x0 < rx1 and rx0 < x1 and y0 < ry1 and ry0 < y1
+                    and watcher not in overlapping):
+                    overlapping.append(watcher)
+        return overlapping
+
+    def tiles_changing(self, x0, y0, x1, y1):
+        overlapping = self._overlapping(x0, y0, x1, y1)
+        # Remember the watchers for the tiles_changed() that follows
+        self._changing = ((x0, y0, x1, y1), overlapping)
+        for watcher in overlapping:
+            watcher.tiles_changing(x0, y0, x1, y1)
+
+    def tiles_changed(self, x0, y0, x1, y1):
+        rect, overlapping = self._changing
+        if rect != (x0, y0, x1, y1):
+            overlapping = self._overlapping(x0, y0, x1, y1)
+        for watcher in overlapping:
+            watcher.tiles_changed(x0, y0, x1, y1)
+
+# Single byte strings of each tile value, for counting with `bytearray.count()`
+_TILE_BYTES = [bytes(bytearray([tile])) for tile in range(256)]
+
+class TileCounts(object):
+    """
+    Histogram of the tiles in the rectangle from (x0, y0) to (x1, y1) of
+    a storage, kept up to date as tiles are written.
+
+    `counts[tile]` is the number of tiles with the value `tile`.
+    """
+
+    def __init__(self, storage, x0, y0, x1, y1):
+        self.storage = storage
+        self.rect = (x0, y0, x1, y1)
+        self.counts = [0] * 256
+        self._count(x0, y0, x1, y1, 1)
+
+    def _count(self, x0, y0, x1, y1, sign):
+        """Add `sign` times the tiles in the part of the rectangle inside ours."""
+        rx0, ry0, rx1, ry1 = self.rect
+        x0 = max(x0, rx0)
+        y0 = max(y0, ry0)
+        x1 = min(x1, rx1)
+        y1 = min(y1, ry1)
+        if x0 >= x1 or y0 >= y1:
+            return
+        counts = self.counts
+        if x1 - x0 == 1 and y1 - y0 == 1:
+            counts[self.storage.tiles[y0 * self.storage.width + x0]] += sign
+            return
+        block = bytearray().join([self.storage.row(y, x0, x1) for y in range(y0, y1)])
+        for tile in set(block):
+            counts[tile] += sign * block.count(_TILE_BYTES[tile])
+
+    def tiles_changing(self, x0, y0, x1, y1):
+        self._count(x0, y0, x1, y1, -1)
+
+    def tiles_changed(self, x0, y0, x1, y1):
+        self._count(x0, y0, x1, y1, 1)
 
 class Coord(namedtuple('Coord', ['x', 'y'])):
     @classmethod
@@ -63,6 +304,9 @@ class Coord(namedtuple('Coord', ['x', 'y'])):
 Coord.X = Coord(1, 0)
 Coord.Y = Coord(0, 1)
 
+# Subscript types that take the single tile fast path
+_tuple_types = (tuple, Coord)
+
 
 class TileMap(object):
     """Subscriptable, editable view onto a TileMap."""
@@ -92,14 +336,15 @@ class TileMap(object):
         self.storage = storage
         self.tl = tl
         self.br = br
+        self.tile_counts = None
 
     @property
     def width(self):
-        return Coord.width(self.tl, self.br)
+        return self.br[0] - self.tl[0]
 
     @property
     def height(self):
-        return Coord.height(self.tl, self.br)
+        return self.br[1] - self.tl[1]
 
     @classmethod
     def clone(cls, tile_map):
@@ -115,6 +360,22 @@ class TileMap(object):
     def _storage_to_local(self, coord):
         return Coord(coord.x - self.tl.x, coord.y - self.tl.y)
 
+    def _local_to_index(self, x, y):
+        """Return the index into `storage.tiles` of local (x, y)."""
+        return (y + self.tl[1]) * self.storage.width + x + self.tl[0]
+
+    def _row_span(self, y):
+        """Return the (start, stop) indices into `storage.tiles` of local row `y`."""
+        start = (y + self.tl[1]) * self.storage.width + self.tl[0]
+        return start, start + self.br[0] - self.tl[0]
+
+    def rows(self):
+        """Return an iterable of the rows of this view, each as a `bytearray`."""
+        tiles = self.storage.tiles
+        for y in range(self.height):
+            start, stop = self._row_span(y)
+            yield tiles[start:stop]
+
     def _parse_subscript(self, subscript):
         if isinstance(subscript, slice):
             assert isinstance(subscript.start, tuple)
@@ -158,15 +419,18 @@ class TileMap(object):
 
     def __str__(self):
         lines = ['']
-        for y in range(self.tl.y, self.br.y):
-            line = []
-            for x in range(self.tl.x, self.br.x):
-                line.append('%3s' % repr(self.storage[Coord(x, y)]))
-            lines.append(' '.join(line))
+        for row in self.rows():
+            lines.append(' '.join('%3s' % repr(tile) for tile in row))
         return '\n    '.join(lines)
 
     def __getitem__(self, subscript):
         """Return the value at (x, y), or a subview of the range (if either x or y is a slice)."""
+        if subscript.__class__ in _tuple_types:
+            x, y = subscript
+            if x.__class__ is int and y.__class__ is int:
+                if 0 <= x < self.br[0] - self.tl[0] and 0 <= y < self.br[1] - self.tl[1]:
+                    return self.storage.tiles[self._local_to_index(x, y)]
+                raise IndexError(subscript)
         tl, br = self._parse_subscript(subscript)
         if Coord.width(tl, br) == 1 and Coord.height(tl, br) == 1:
             tl = self._local_to_storage(tl)
@@ -176,13 +440,24 @@ class TileMap(object):
 
     def __setitem__(self, subscript, value):
         """Set the value at (x, y), or fill the range (if either x or y is a slice) with the value."""
+        if subscript.__class__ in _tuple_types and not isinstance(value, TileMap):
+            x, y = subscript
+            if x.__class__ is int and y.__class__ is int:
+                if 0 <= x < self.br[0] - self.tl[0] and 0 <= y < self.br[1] - self.tl[1]:
+                    storage = self.storage
+                    if storage.watchers:
+                        storage[(x + self.tl[0], y + self.tl[1])] = value
+                    else:
+                        storage.tiles[self._local_to_index(x, y)] = value
+                    return
+                raise IndexError(subscript)
         tl, br = self._parse_subscript(subscript)
         if isinstance(value, TileMap):
-            for coord in Coord.range(tl, br):
-                coord = self._local_to_storage(coord)
-                other_coord = Coord(coord.x - tl.x, coord.y - tl.y)
-                other_coord = value._local_to_storage(other_coord)
-                self.storage[coord] = value.storage[other_coord]
+            if value.width < Coord.width(tl, br) or value.height < Coord.height(tl, br):
+                raise IndexError(subscript)
+            tl = self._local_to_storage(tl)
+            br = self._local_to_storage(br)
+            self.storage.blit(tl.x, tl.y, br.x, br.y, value.storage, value.tl.x, value.tl.y)
         else:
             if Coord.width(tl, br) == 1 and Coord.height(tl, br) == 1:
                 tl = self._local_to_storage(tl)
@@ -193,9 +468,7 @@ class TileMap(object):
     def __contains__(self, value):
         if isinstance(value, TileMap):
             raise TypeError("__contains__ does not support TileMaps yet.")
-        for coord, __ in self.find(is_tile(value)):
-            return True
-        return False
+        return self.any(is_tile(value))
 
     def get(self, subscript):
         try:
@@ -203,17 +476,135 @@ class TileMap(object):
         except IndexError:
             return None
 
-    def find(self, predicate):
+    def find(self, predicate, where=None):
         """
         Return an iterable of `(coordinate, data)` for which
         `predicate(tile_map, coord)` returns a not False `data`.
+
+        If `where` is given, only the coordinates set in that raster
+        (as returned by `mask()`) are tried, still in row-major order.
+
+        Mask predicates (see `filters.is_tile`) are evaluated for the
+        whole view at once when iteration starts, with `data` being True.
         """
-        for coord in Coord.range(self.tl, self.br):
-            tile = self.storage[coord]
-            arg = self._storage_to_local(coord)
+        if where is not None:
+            return self._find_where(predicate, where)
+        if hasattr(predicate, 'mask'):
+            return ((coord, True) for coord in self.find_mask(predicate))
+        return self._find(predicate)
+
+    def _find_where(self, predicate, where):
+        assert len(where) == self.width * self.height
+        width = self.width
+        i = where.find(b'\x01')
+        while i != -1:
+            y, x = divmod(i, width)
+            arg = Coord(x, y)
             data = predicate(self, arg)
             if data:
                 yield (arg, data)
+            i = where.find(b'\x01', i + 1)
+
+    def _find(self, predicate):
+        # Count local coordinates directly, rather than converting each
+        # storage coordinate, so there is one `Coord` per tile tried
+        for y in range(self.height):
+            for x in range(self.width):
+                arg = Coord(x, y)
+                data = predicate(self, arg)
+                if data:
+                    yield (arg, data)
+
+    def translate(self, table):
+        """
+        Return a `bytearray` raster of this view's tiles (row-major,
+        `width` bytes per row) mapped through the translation `table`.
+        """
+        tiles = self.storage.tiles
+        if self.width == self.storage.width:
+            start, __ = self._row_span(0)
+            __, stop = self._row_span(self.height - 1)
+            raster = tiles[start:stop].translate(table)
+        else:
+            raster = bytearray().join(row.translate(table) for row in self.rows())
+        if not isinstance(raster, bytearray):
+            raster = bytearray(raster)
+        return raster
+
+    def mask(self, predicate):
+        """Return the boolean raster (one 0 or 1 byte per tile) of a mask predicate."""
+        return predicate.mask(self)
+
+    def find_mask(self, predicate):
+        """Return an iterable of the coordinates where the mask predicate is set."""
+        raster = predicate.mask(self)
+        width = self.width
+        i = raster.find(b'\x01')
+        while i != -1:
+            y, x = divmod(i, width)
+            yield Coord(x, y)
+            i = raster.find(b'\x01', i + 1)
+
+    def track_tiles(self):
+        """Keep a `TileCounts` of this view up to date, so that `count()`,
+        `any()` and `all()` of `filters.is_tile` predicates (and `in`)
+        take constant time. Returns this view."""
+        if self.tile_counts is None:
+            rect = (self.tl.x, self.tl.y, self.br.x, self.br.y)
+            self.tile_counts = TileCounts(self.storage, *rect)
+            self.storage.watch_region(self.tile_counts, *rect)
+        return self
+
+    def untrack_tiles(self):
+        """Stop keeping the `TileCounts` of this view up to date."""
+        if self.tile_counts is not None:
+            self.storage.unwatch_region(self.tile_counts)
+            self.tile_counts = None
+
+    def _tracked_count(self, predicate):
+        """Return the count of `predicate` from the tracked tile counts, or None."""
+        if self.tile_counts is None:
+            return None
+        counts = self.tile_counts.counts
+        tiles = getattr(predicate, 'tiles', None)
+        if tiles is not None:
+            return sum(counts[tile] for tile in tiles if tile is not None and 0 <= tile < 256)
+        not_tiles = getattr(predicate, 'not_tiles', None)
+        if not_tiles is not None:
+            count = sum(counts[tile] for tile in not_tiles if tile is not None and 0 <= tile < 256)
+            return self.width * self.height - count
+        return None
+
+    def any(self, predicate):
+        """Return True if `predicate` holds for any tile in this view."""
+        count = self._tracked_count(predicate)
+        if count is not None:
+            return count > 0
+        if hasattr(predicate, 'mask'):
+            return b'\x01' in predicate.mask(self)
+        for coord, __ in self._find(predicate):
+            return True
+        return False
+
+    def all(self, predicate):
+        """Return True if `predicate` holds for every tile in this view."""
+        count = self._tracked_count(predicate)
+        if count is not None:
+            return count == self.width * self.height
+        if hasattr(predicate, 'mask'):
+            return b'\x00' not in predicate.mask(self)
+        for coord, __ in self._find(is_not(predicate)):
+            return False
+        return True
+
+    def count(self, predicate):
+        """Return the number of tiles in this view for which `predicate` holds."""
+        count = self._tracked_count(predicate)
+        if count is not None:
+            return count
+        if hasattr(predicate, 'mask'):
+            return predicate.mask(self).count(b'\x01')
+        return sum(1 for __ in self._find(predicate))
 
     def cast_until(self, start, increment, predicate):
         """
@@ -221,26 +612,71 @@ class TileMap(object):
         of `increment` where `predicate(tile_map, coord)` returns True.
 
         Raises ValueError if the predicate never returned True.
+
+        Casting straight down with a `filters.is_tile` predicate (or its
+        `is_not`) is answered from the storage's `ColumnIndex`.
         """
-        coord = start
-        end = self._storage_to_local(self.br)
-        def in_range(coord):
-            return (coord.x < end.x and coord.y < end.y)
-        while in_range(coord) and not predicate(self, coord):
-            coord += increment
-        if in_range(coord):
-            return coord
+        if (tuple(increment) == (0, 1)
+            and 0 <= start[0] < self.width and 0 <= start[1] < self.height):
+            tiles = getattr(predicate, 'tiles', None)
+            not_tiles = getattr(predicate, 'not_tiles', None)
+            if tiles is not None or not_tiles is not None:
+                x = start[0] + self.tl.x
+                y = start[1] + self.tl.y
+                if tiles is not None:
+                    y = self.storage.column_index(tiles).below(x, y)
+                else:
+                    y = self.storage.column_index(not_tiles).run_end(x, y)
+                if y < self.br.y:
+                    return Coord(start[0], y - self.tl.y)
+                raise ValueError("Coordinate matching predicate not found.")
+        x, y = start
+        dx, dy = increment
+        width, height = self.width, self.height
+        tiles = getattr(predicate, 'tiles', None)
+        not_tiles = getattr(predicate, 'not_tiles', None)
+        if tiles is not None or not_tiles is not None:
+            # Step a flat index through the storage while inside the view,
+            # making a `Coord` only for the result
+            storage_tiles = self.storage.tiles
+            step = dy * self.storage.width + dx
+            i = self._local_to_index(x, y)
+            while 0 <= x < width and 0 <= y < height:
+                if tiles is not None:
+                    if storage_tiles[i] in tiles:
+                        return Coord(x, y)
+                elif storage_tiles[i] not in not_tiles:
+                    return Coord(x, y)
+                x += dx
+                y += dy
+                i += step
+        while x < width and y < height and not predicate(self, Coord(x, y)):
+            x += dx
+            y += dy
+        if x < width and y < height:
+            return Coord(x, y)
         else:
             raise ValueError("Coordinate matching predicate not found.")
 
+    def column_index(self, tiles):
+        """Return the storage's `ColumnIndex` for `tiles` (in storage coordinates)."""
+        return self.storage.column_index(tiles)
+
     def copy(self):
+        """Return a view of the same region onto a copy of the storage."""
         subview = self.subview()
         subview.storage = self.storage.copy()
         return subview
 
     def fill(self, value):
-        for coord in Coord.range(self.tl, self.br):
-            self.storage[coord] = value
+        self.storage.fill_rect(self.tl.x, self.tl.y, self.br.x, self.br.y, value)
+
+    def paint(self, rects, value):
+        """Fill each `(tl, br)` rectangle in `rects` (in local coordinates) with `value`."""
+        rects = [self._parse_subscript(slice(tl, br)) for (tl, br) in rects]
+        fill_rect = self.storage.fill_rect
+        for tl, br in rects:
+            fill_rect(tl.x + self.tl.x, tl.y + self.tl.y, br.x + self.tl.x, br.y + self.tl.y, value)
 
     def subview(self, tl=None, br=None):
         """Return a subview at the given location (default top left) and size (default maximum)."""
@@ -258,7 +694,7 @@ class TileMap(object):
 
     def linearize(self):
         """Return a linear iterable of all values in this tile map."""
-        return (self.storage[coord] for coord in Coord.range(self.tl, self.br))
+        return itertools.chain.from_iterable(self.rows())
 
     def split_x(self, x):
         """Return a pair of views that are the halves of the tile map split vertically at `x`."""
@@ -1,4 +1,4 @@
-__all__ = ('contains_subsequence', 'shortest_subsequence')
+__all__ = ('contains_subsequence', 'shortest_subsequence', 'RemovableSequence')
 
 def contains_subsequence(seq, subseq):
     for i in range(len(seq) - len(subseq)):
@@ -25,4 +25,63 @@ def shortest_subsequence(seq, value):
     if subseq_len_min == len(seq) + 1:
         return 0
     else:
-        return subseq_len_min
\ No newline at end of file
+        return subseq_len_min
+
+
+class RemovableSequence(object):
+    """
+    Sequence of `items` that items can be removed from by their original
+    index. Indexing, `len()` and removal all take O(log n), so it can be
+    given to `random.choice()` as the list of remaining items.
+    """
+
+    def __init__(self, items):
+        self.items = list(items)
+        self.alive = bytearray([1]) * len(self.items)
+        self.length = len(self.items)
+        # Fenwick tree of the number of remaining items
+        tree = [0] * (self.length + 1)
+        for i in range(1, self.length + 1):
+            tree[i] += 1
+            parent = i + (i & -i)
+            if parent <= self.length:
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        tree = self.tree
+        position = 0
+        remaining = index + 1
+        step = 1
+        while step * 2 <= len(self.items):
+            step *= 2
+        while step:
+            next_position = position + step
+            if next_position <= len(self.items) and tree[next_position] < remaining:
+                position = next_position
+                remaining -= tree[next_position]
+            step //= 2
+        return self.items[position]
+
+    def __iter__(self):
+        for i, item in enumerate(self.items):
+            if self.alive[i]:
+                yield item
+
+    def remove(self, i):
+        """Remove the item that was at index `i` of `items`, if it is still here."""
+        if not self.alive[i]:
+            return
+        self.alive[i] = 0
+        self.length -= 1
+        i += 1
+        while i <= len(self.items):
+            self.tree[i] -= 1
+            i += (i & -i)
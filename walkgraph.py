@@ -0,0 +1,187 @@
+__all__ = ('WalkGraph', 'WALK', 'STAIR', 'DROP', 'LADDER')
+
+from array import array
+from tilemap import Coord
+
+# Edge kinds
+WALK = 0
+STAIR = 1
+DROP = 2
+LADDER = 3
+EDGE_KIND_NAMES = {
+    WALK: 'walk',
+    STAIR: 'stair',
+    DROP: 'drop',
+    LADDER: 'ladder',
+    }
+
+
+class WalkGraph(object):
+    """
+    Compressed sparse row graph of where you can walk to in a tile map.
+
+    Node ids are flat tile indices (`y * width + x`). `nodes` has a 1 for
+    each tile in the graph (even if it has no edges), and the edges of node
+    `i` are `targets[offsets[i]:offsets[i + 1]]`, with the edge kinds in
+    `kinds` at the same indices. `start` is the node id the graph was
+    searched from, if any.
+
+    A WalkGraph is never changed after it is built. It also behaves as
+    the read-only dict of `Coord` to list of reachable `Coord`s that
+    `calculate_walk_graph` used to return.
+    """
+
+    def __init__(self, width, height, nodes, offsets, targets, kinds, start=None):
+        assert len(nodes) == width * height
+        assert len(offsets) == width * height + 1
+        assert len(targets) == len(kinds) == offsets[-1]
+        self.width = width
+        self.height = height
+        self.nodes = nodes
+        self.offsets = offsets
+        self.targets = targets
+        self.kinds = kinds
+        self.start = start
+        self._node_count = nodes.count(b'\x01')
+        self._reverse = None
+
+    @classmethod
+    def from_edges(cls, width, height, edges, start=None):
+        """Build a graph from a dict of node id to a list of `(target id, kind)` pairs."""
+        size = width * height
+        nodes = bytearray(size)
+        offsets = array('i', [0]) * (size + 1)
+        targets = array('i')
+        kinds = bytearray()
+        for node in sorted(edges):
+            nodes[node] = 1
+            offsets[node + 1] = len(edges[node])
+            for target, kind in edges[node]:
+                targets.append(target)
+                kinds.append(kind)
+        total = 0
+        for i in range(1, size + 1):
+            total += offsets[i]
+            offsets[i] = total
+        return cls(width, height, nodes, offsets, targets, kinds, start)
+
+    def index(self, coord):
+        """Return the node id of `coord`."""
+        return coord[1] * self.width + coord[0]
+
+    def coord(self, node):
+        """Return the `Coord` of node id `node`."""
+        y, x = divmod(node, self.width)
+        return Coord(x, y)
+
+    def _node(self, coord):
+        x, y = coord
+        if 0 <= x < self.width and 0 <= y < self.height:
+            node = y * self.width + x
+            if self.nodes[node]:
+                return node
+        return None
+
+    @property
+    def edge_count(self):
+        return len(self.targets)
+
+    def neighbor_ids(self, node):
+        """Return the node ids reachable in one step from node id `node`."""
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    def neighbors(self, coord):
+        """Return a list of the coords reachable in one step from `coord`."""
+        node = self._node(coord)
+        if node is None:
+            return []
+        return [self.coord(target) for target in self.neighbor_ids(node)]
+
+    def edges(self, coord):
+        """Return a list of `(coord, kind)` for the edges from `coord`."""
+        node = self._node(coord)
+        if node is None:
+            return []
+        start, stop = self.offsets[node], self.offsets[node + 1]
+        return [(self.coord(self.targets[i]), self.kinds[i]) for i in range(start, stop)]
+
+    def has_edge(self, coord, other):
+        """Return True if `other` is reachable in one step from `coord`."""
+        node = self._node(coord)
+        if node is None:
+            return False
+        return self.index(other) in self.neighbor_ids(node)
+
+    def reverse(self):
+        """Return the graph with every edge reversed (built once, then cached)."""
+        if self._reverse is None:
+            size = self.width * self.height
+            offsets = array('i', [0]) * (size + 1)
+            for target in self.targets:
+                offsets[target + 1] += 1
+            total = 0
+            for i in range(1, size + 1):
+                total += offsets[i]
+                offsets[i] = total
+            fill = array('i', offsets)
+            targets = array('i', [0]) * len(self.targets)
+            kinds = bytearray(len(self.kinds))
+            self_offsets = self.offsets
+            self_targets = self.targets
+            self_kinds = self.kinds
+            node = self.nodes.find(b'\x01')
+            while node != -1:
+                for i in range(self_offsets[node], self_offsets[node + 1]):
+                    target = self_targets[i]
+                    targets[fill[target]] = node
+                    kinds[fill[target]] = self_kinds[i]
+                    fill[target] += 1
+                node = self.nodes.find(b'\x01', node + 1)
+            self._reverse = self.__class__(self.width, self.height,
+                self.nodes, offsets, targets, kinds, self.start)
+            self._reverse._reverse = self
+        return self._reverse
+
+    def predecessors(self, coord):
+        """Return a list of the coords from which `coord` is reachable in one step."""
+        return self.reverse().neighbors(coord)
+
+    # Dict compatible view
+
+    def __len__(self):
+        return self._node_count
+
+    def __contains__(self, coord):
+        return self._node(coord) is not None
+
+    def __getitem__(self, coord):
+        node = self._node(coord)
+        if node is None:
+            raise KeyError(coord)
+        return [self.coord(target) for target in self.neighbor_ids(node)]
+
+    def get(self, coord, default=None):
+        node = self._node(coord)
+        if node is None:
+            return default
+        return [self.coord(target) for target in self.neighbor_ids(node)]
+
+    def __iter__(self):
+        nodes = self.nodes
+        node = nodes.find(b'\x01')
+        while node != -1:
+            yield self.coord(node)
+            node = nodes.find(b'\x01', node + 1)
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [self[coord] for coord in self]
+
+    def items(self):
+        return [(coord, self[coord]) for coord in self]
+
+    def copy(self):
+        # The graph is never changed, so there is nothing to copy.
+        return self